@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""
+benchmark: documents inserted per second, direct vs. BatchedInsert
+
+Uses a local mock document store: each insert() call costs one simulated
+database round trip (``--latency``) plus a small cost per document.
+
+    python benchmarks/bench_batched_insert.py --events 2000 --latency 0.001
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("INSTRUMENT_HEADLESS", "1")
+
+import event_model
+
+from instrument.callbacks.batching import BatchedInsert
+
+
+class MockDocumentStore:
+    """count documents; each insert() call sleeps for one round trip"""
+
+    def __init__(self, latency=0.001, per_document=2e-6):
+        self.latency = latency
+        self.per_document = per_document
+        self.calls = 0
+        self.documents = 0
+
+    def insert(self, name, doc):
+        if name == "event_page":
+            n = len(doc["uid"])
+        elif name == "datum_page":
+            n = len(doc["datum_id"])
+        else:
+            n = 1
+        time.sleep(self.latency + n * self.per_document)
+        self.calls += 1
+        self.documents += n
+
+
+def make_run(num_events):
+    """documents of one run: events, each with one datum (area detector)"""
+    bundle = event_model.compose_run()
+    docs = [("start", bundle.start_doc)]
+    resource_bundle = bundle.compose_resource(
+        spec="AD_HDF5",
+        root="/tmp",
+        resource_path="simdet.h5",
+        resource_kwargs={"frame_per_point": 1},
+    )
+    docs.append(("resource", resource_bundle.resource_doc))
+    descriptor_bundle = bundle.compose_descriptor(
+        name="primary",
+        data_keys={
+            "m1": dict(source="sim", dtype="number", shape=[]),
+            "det": dict(source="sim", dtype="number", shape=[]),
+            "image": dict(
+                source="sim", dtype="array", shape=[64, 64], external="FS"
+            ),
+        },
+    )
+    docs.append(("descriptor", descriptor_bundle.descriptor_doc))
+    for i in range(num_events):
+        datum = resource_bundle.compose_datum(datum_kwargs={"point_number": i})
+        docs.append(("datum", datum))
+        t = time.time()
+        event = descriptor_bundle.compose_event(
+            data={"m1": i * 0.1, "det": i ** 0.5, "image": datum["datum_id"]},
+            timestamps={"m1": t, "det": t, "image": t},
+            filled={"image": False},
+        )
+        docs.append(("event", event))
+    docs.append(("stop", bundle.compose_stop()))
+    return docs
+
+
+def run(label, docs, insert, store):
+    t0 = time.time()
+    for name, doc in docs:
+        insert(name, doc)
+    elapsed = time.time() - t0
+    print(
+        f"{label:>10s}: {store.documents} documents"
+        f" in {store.calls} calls, {elapsed:.3f} s,"
+        f" {store.documents / elapsed:.0f} documents/s"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.001)
+    parser.add_argument("--page", type=int, default=100)
+    args = parser.parse_args()
+
+    docs = make_run(args.events)
+
+    store = MockDocumentStore(args.latency)
+    before = run("direct", docs, store.insert, store)
+
+    store = MockDocumentStore(args.latency)
+    batched = BatchedInsert(
+        store.insert, max_events=args.page, max_datums=args.page
+    )
+    after = run("batched", docs, batched, store)
+
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
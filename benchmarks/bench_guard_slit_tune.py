@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+"""
+benchmark: guard slit blade tune, step scan vs. fly scan
+
+Tunes a simulated blade (``instrument.usaxs.simulated``, no IOC) with
+each tune mode of ``tune_blade_edge``: step scan of all points
+("full"), step scan that stops at the edge ("stream"), coarse then
+fine step scans ("adaptive"), and one move while counting ("fly").
+Reports the time, the number of points analyzed, and the error of the
+edge found: ``peak_center`` of the derivative, and the erf fit.
+
+    python benchmarks/bench_guard_slit_tune.py --points 61 --count-time 0.25
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+os.environ.setdefault("INSTRUMENT_HEADLESS", "1")
+
+from bluesky import RunEngine
+from bluesky import plan_stubs as bps
+
+import instrument
+
+
+def load(name):
+    """import instrument.usaxs.<name> alone (no IOC, no framework)"""
+    path = os.path.join(
+        os.path.dirname(instrument.__file__), "usaxs", f"{name}.py"
+    )
+    full_name = f"instrument.usaxs.{name}"
+    spec = importlib.util.spec_from_file_location(full_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[full_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+derivative = load("derivative")
+peak_centers = load("peak_centers")
+edge_stats = load("edge_stats")
+fitting = load("fitting")
+fly = load("fly_scan")
+simulated = load("simulated")
+
+
+def tune(RE, mode, blade, scaler, start, end, num, count_time):
+    """scan the blade in ``mode``, returns (x, y)"""
+    name = scaler.counts.name
+    if mode in ("full", "stream"):
+        stats = edge_stats.EdgeStatistics(blade.name, name, min_change=500)
+        RE(
+            edge_stats.edge_scan(
+                [scaler],
+                blade,
+                start,
+                end,
+                num,
+                stats,
+                stop_early=mode == "stream",
+            )
+        )
+        return stats.x_data, stats.y_data
+    if mode == "adaptive":
+        plan = edge_stats.adaptive_edge_scan(
+            [scaler], blade, start, end, num, name, min_change=500
+        )
+    else:
+        plan = fly.fly_scan(
+            [scaler], blade, start, end, name, num, count_time
+        )
+    result = {}
+
+    def keep(plan):
+        result["xy"] = yield from plan
+
+    RE(keep(plan))
+    return result["xy"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--points", type=int, default=61)
+    parser.add_argument("--count-time", type=float, default=0.25)
+    parser.add_argument("--settle-time", type=float, default=0.1)
+    parser.add_argument("--velocity", type=float, default=1.0)
+    args = parser.parse_args()
+
+    start, end, edge = 0.2, -0.3, 0.0
+    RE = RunEngine({})
+    blade, scaler = simulated.simulated_blade(
+        position=start,
+        velocity=args.velocity,
+        settle_time=args.settle_time,
+        preset_time=args.count_time,
+        edge=edge,
+        width=0.02,
+    )
+    times = {}
+    for mode in "full stream adaptive fly".split():
+        blade.velocity.put(args.velocity)
+        RE(bps.mv(blade, start))
+        t0 = time.time()
+        x, y = tune(
+            RE, mode, blade, scaler, start, end, args.points, args.count_time
+        )
+        times[mode] = time.time() - t0
+        position, width = peak_centers.peak_center(
+            *derivative.numerical_derivative(x, y)
+        )
+        fit = fitting.fit_edge(x, y)
+        print(
+            f"{mode:>8s}: {times[mode]:6.2f} s, {len(x):3d} points,"
+            f" edge error {position - edge:+.4f} (fit"
+            f" {fit.center - edge:+.4f} +/- {fit.center_error:.4f})"
+        )
+    print(f"fly scan speedup: {times['full'] / times['fly']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""
+benchmark: cost of one log call in the calling (RunEngine) thread
+
+Compares a logger writing directly to a rotating log file with the same
+logger queued (a background thread formats, writes, rotates, and
+compresses the files), as in ``instrument.session_logs``.
+
+    python benchmarks/bench_logging.py --calls 20000
+"""
+
+import argparse
+import logging
+import logging.handlers
+import os
+import tempfile
+import time
+
+os.environ.setdefault("INSTRUMENT_HEADLESS", "1")
+
+from instrument.session_logs import compress_rotated_logs
+from instrument.session_logs import queue_handlers
+
+FORMAT = (
+    "|%(asctime)s|%(levelname)s|%(process)d|%(name)s|%(module)s"
+    "|%(lineno)d|%(threadName)s| - %(message)s"
+)
+
+
+def make_logger(name, log_file, max_bytes):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=9
+    )
+    handler.setFormatter(logging.Formatter(FORMAT))
+    logger.addHandler(handler)
+    return logger, handler
+
+
+def run(label, logger, calls):
+    t0 = time.perf_counter()
+    for i in range(calls):
+        logger.info("tune step %d: position=%f counts=%d", i, i * 0.01, i)
+    elapsed = time.perf_counter() - t0
+    print(
+        f"{label:>8s}: {1e6 * elapsed / calls:.2f} us per call"
+        f" ({calls} calls in {elapsed:.3f} s)"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--max-bytes", type=int, default=256 * 1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        logger, handler = make_logger(
+            "bench-direct", os.path.join(tmp, "direct.log"), args.max_bytes
+        )
+        before = run("direct", logger, args.calls)
+        handler.close()
+
+        logger, handler = make_logger(
+            "bench-queued", os.path.join(tmp, "queued.log"), args.max_bytes
+        )
+        compress_rotated_logs(handler, total_bytes=10 * args.max_bytes)
+        listener = queue_handlers(logger)
+        after = run("queued", logger, args.calls)
+        t0 = time.perf_counter()
+        listener.stop()  # wait for the background thread to write all
+        print(
+            "  (background thread finished"
+            f" {time.perf_counter() - t0:.3f} s later)"
+        )
+        handler.close()
+
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+"""
+benchmark: count plans per second, RE.md as PersistentDict vs. coalesced
+
+Each run changes RE.md (the scan_id).  Runs many short ``count`` plans
+with a simulated detector and no subscribers, so the RE.md storage is
+most of the difference.  Also times loading the metadata (``--keys``
+extra keys in RE.md).
+
+    python benchmarks/bench_re_md.py --runs 200 --keys 1000
+"""
+
+import argparse
+import importlib.util
+import os
+import tempfile
+import time
+
+os.environ.setdefault("INSTRUMENT_HEADLESS", "1")
+
+from bluesky import RunEngine
+from bluesky.plans import count
+from bluesky.utils import PersistentDict
+from ophyd.sim import det
+import numpy as np
+
+import instrument
+
+
+def load_md_store():
+    """import md_store alone (not the framework: no database, no devices)"""
+    path = os.path.join(
+        os.path.dirname(instrument.__file__), "framework", "md_store.py"
+    )
+    spec = importlib.util.spec_from_file_location(
+        "instrument.framework.md_store", path
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.CoalescingMetadataStore
+
+
+def fill(md, keys):
+    """RE.md that has grown: many keys, some arrays"""
+    for i in range(keys):
+        md[f"key_{i}"] = f"value {i}"
+    md["array"] = np.arange(10_000)
+
+
+def run(label, md, runs, load_time):
+    RE = RunEngine({})
+    RE.md = md
+    t0 = time.time()
+    for _ in range(runs):
+        RE(count([det], num=1))
+    elapsed = time.time() - t0
+    print(
+        f"{label:>14s}: {runs} runs in {elapsed:.3f} s,"
+        f" {runs / elapsed:.1f} runs/s, load {load_time * 1e3:.1f} ms"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--keys", type=int, default=1000)
+    args = parser.parse_args()
+    CoalescingMetadataStore = load_md_store()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "persistent")
+        fill(PersistentDict(path), args.keys)
+        t0 = time.time()
+        md = PersistentDict(path)
+        dict(md)  # PersistentDict reads each key from its own file
+        before = run("PersistentDict", md, args.runs, time.time() - t0)
+
+        filename = os.path.join(tmp, "coalesced.msgpack")
+        md = CoalescingMetadataStore(filename)
+        fill(md, args.keys)
+        md.close()
+        t0 = time.time()
+        md = CoalescingMetadataStore(filename)
+        after = run("coalesced", md, args.runs, time.time() - t0)
+        md.close()
+
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
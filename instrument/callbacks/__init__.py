@@ -1,3 +1,14 @@
 """
 local, custom Bluesky callbacks
 """
+
+from ..session_logs import HEADLESS
+
+from .batching import *
+from .dispatch import *
+from .journal import *
+from .timing import *
+if not HEADLESS:
+    from .live_plots import *  # imports pyplot
+from .spec_writer import *
+from .spec_index import *
@@ -0,0 +1,118 @@
+"""
+batched database inserts: events into event pages, datums into datum pages
+
+Called with each document (like ``db.insert``), a :class:`BatchedInsert`
+holds consecutive ``event`` documents (per descriptor) and ``datum``
+documents (per resource), then inserts them as ``event_page`` and
+``datum_page`` documents: one database round trip per page instead of
+one per document.
+
+Pages are inserted when a buffer reaches its size, when the oldest
+buffered document reaches ``max_age``, and always before any other
+document (``start``, ``descriptor``, ``resource``, ``stop``, ...) so the
+database sees the documents in a consistent order.  Datum pages are
+inserted before the event pages that might refer to them.
+
+EXAMPLE::
+
+    callback_db["db"] = RE.subscribe(BatchedInsert(db.insert))
+"""
+
+__all__ = [
+    "BatchedInsert",
+]
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+import threading
+import time
+
+import event_model
+
+
+class BatchedInsert:
+    """
+    collect events & datums into pages for ``insert(name, doc)``
+
+    PARAMETERS
+
+    insert : callable
+        ``insert(name, doc)``, such as ``db.insert``
+    max_events : int
+        insert an event page when this many events are held
+    max_datums : int
+        insert a datum page when this many datums are held
+    max_age : float
+        insert the pages when the oldest held document is this old (s)
+    """
+
+    def __init__(self, insert, max_events=100, max_datums=100, max_age=1.0):
+        self.insert = insert
+        self.max_events = max_events
+        self.max_datums = max_datums
+        self.max_age = max_age
+
+        self._events = {}  # descriptor uid: [event documents]
+        self._num_events = 0
+        self._datums = {}  # resource uid: [datum documents]
+        self._num_datums = 0
+        self._oldest = None  # time the oldest held document arrived
+        self._timer = None
+        self._lock = threading.RLock()
+
+    def __call__(self, name, doc):
+        with self._lock:
+            if name == "event":
+                self._hold()
+                self._events.setdefault(doc["descriptor"], []).append(doc)
+                self._num_events += 1
+                if self._num_events >= self.max_events:
+                    self.flush()
+            elif name == "datum":
+                self._hold()
+                self._datums.setdefault(doc["resource"], []).append(doc)
+                self._num_datums += 1
+                if self._num_datums >= self.max_datums:
+                    self.flush()
+            else:
+                self.flush()
+                self.insert(name, doc)
+            if (
+                self._oldest is not None
+                and time.time() - self._oldest >= self.max_age
+            ):
+                self.flush()
+
+    def _hold(self):
+        """a document will be held: note the time, start the flush timer"""
+        if self._oldest is None:
+            self._oldest = time.time()
+            self._timer = threading.Timer(self.max_age, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """insert all held documents now (as pages)"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._oldest = None
+            if self._num_datums > 0:
+                datums, self._datums = self._datums, {}
+                self._num_datums = 0
+                for resource_datums in datums.values():
+                    self.insert(
+                        "datum_page",
+                        event_model.pack_datum_page(*resource_datums),
+                    )
+            if self._num_events > 0:
+                events, self._events = self._events, {}
+                self._num_events = 0
+                for descriptor_events in events.values():
+                    self.insert(
+                        "event_page",
+                        event_model.pack_event_page(*descriptor_events),
+                    )
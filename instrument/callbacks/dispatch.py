@@ -0,0 +1,161 @@
+"""
+queued document dispatch: each subscriber in its own thread
+
+The RunEngine calls its subscribers synchronously, so a slow database
+insert or plot redraw stalls the acquisition.  A :class:`QueuedCallback`
+receives the documents in the RunEngine thread, puts them in its own
+bounded queue, and a worker thread calls the real callback.
+
+When the queue is full, the *policy* decides:
+
+``"block"``
+    wait for room in the queue (RunEngine slows to the callback's pace)
+``"drop-oldest"``
+    discard the oldest queued event (for plots), never start,
+    descriptor, or stop documents
+``"never-drop"``
+    the queue grows without limit (for storage)
+
+On a ``stop`` document, the RunEngine waits until the queue is empty
+(all documents of the run have been handled), unless ``stop_timeout=0``.
+
+EXAMPLE::
+
+    callback_db["db"] = RE.subscribe(
+        QueuedCallback(db.insert, "db", policy="never-drop")
+    )
+"""
+
+__all__ = [
+    "QueuedCallback",
+]
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+import collections
+import threading
+import time
+
+POLICIES = ("block", "drop-oldest", "never-drop")
+DROPPABLE = ("event", "event_page", "bulk_events")
+
+
+class QueuedCallback:
+    """
+    call ``callback(name, doc)`` from a worker thread, through a queue
+
+    PARAMETERS
+
+    callback : callable
+        the subscriber, ``callback(name, doc)``
+    name : str
+        name of this subscriber (for the worker thread and the logs)
+    policy : str
+        what to do when the queue is full: one of ``POLICIES``
+    maxsize : int
+        queue capacity (ignored by ``"never-drop"``)
+    stop_timeout : float
+        (optional) longest time (seconds) to wait at ``stop``
+        for the queue to empty (default: no limit, 0: do not wait)
+    """
+
+    def __init__(
+        self,
+        callback,
+        name=None,
+        policy="block",
+        maxsize=1000,
+        stop_timeout=None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"policy '{policy}' must be one of {POLICIES}")
+        self.callback = callback
+        self.name = name or getattr(callback, "__name__", str(callback))
+        self.policy = policy
+        self.maxsize = maxsize
+        self.stop_timeout = stop_timeout
+        self.dropped = 0
+        self._dropped_reported = 0
+
+        self._queue = collections.deque()
+        self._busy = False  # worker is handling a document
+        self._cv = threading.Condition()
+        self._worker = threading.Thread(
+            target=self._run, name=f"QueuedCallback-{self.name}", daemon=True
+        )
+        self._worker.start()
+
+    def __call__(self, name, doc):
+        with self._cv:
+            while (
+                self.policy != "never-drop"
+                and len(self._queue) >= self.maxsize
+            ):
+                if self.policy == "drop-oldest" and self._drop_oldest():
+                    break
+                self._cv.wait()
+            self._queue.append((name, doc))
+            self._cv.notify_all()
+        if name == "stop" and self.dropped > self._dropped_reported:
+            logger.warning(
+                "%s: %d events dropped (queue full)",
+                self.name,
+                self.dropped - self._dropped_reported,
+            )
+            self._dropped_reported = self.dropped
+        if name == "stop" and self.stop_timeout != 0:
+            if not self.flush(self.stop_timeout):
+                logger.warning(
+                    "%s: %d documents still queued after %s s",
+                    self.name,
+                    len(self._queue),
+                    self.stop_timeout,
+                )
+
+    def _drop_oldest(self):
+        """remove the oldest event from the queue, True if one was found"""
+        for i, (name, doc) in enumerate(self._queue):
+            if name in DROPPABLE:
+                del self._queue[i]
+                self.dropped += 1
+                return True
+        return False
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while len(self._queue) == 0:
+                    self._cv.wait()
+                name, doc = self._queue.popleft()
+                self._busy = True
+                self._cv.notify_all()
+            try:
+                self.callback(name, doc)
+            except Exception:
+                logger.exception("%s: error handling '%s'", self.name, name)
+            finally:
+                with self._cv:
+                    self._busy = False
+                    self._cv.notify_all()
+
+    @property
+    def pending(self):
+        """number of documents not yet handled"""
+        with self._cv:
+            return len(self._queue) + int(self._busy)
+
+    def flush(self, timeout=None):
+        """wait until all queued documents are handled, True if done"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cv:
+            while len(self._queue) > 0 or self._busy:
+                if deadline is None:
+                    self._cv.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._cv.wait(remaining)
+        return True
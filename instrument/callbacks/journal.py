@@ -0,0 +1,338 @@
+"""
+local write-ahead journal of all documents, replayed into the database
+
+Subscribed ahead of the database, a :class:`DocumentJournal` appends
+every document to a local file before the database sees it.  The
+database insert can then run behind it (queued, in its own thread),
+so acquisition is paced by the local disk, not by the database.
+When the database is slow or down, no document is lost: use
+:func:`replay_journal` to load the missed documents later.
+
+Each document is one frame::
+
+    magic (2 bytes: b"BJ")
+    document name (1 byte, index into DOCUMENT_NAMES, or OTHER)
+    payload length (4 bytes, little-endian)
+    CRC32 of the payload (4 bytes, little-endian)
+    payload (JSON, UTF-8: the document, or [name, document] for OTHER)
+
+Files are named ``journal-YYYYmmdd-HHMMSS-NNN.bdj`` and rotated by size.
+A frame left incomplete by a crash ends the reading of its file.  The
+oldest files are removed when all of them are larger than
+``max_total_bytes`` (checked at start and at each rotation), so the
+journal keeps the most recent documents, not all of them.
+
+EXAMPLE::
+
+    replay_journal(db.insert, stored=database_uids(db), remove=True)
+"""
+
+__all__ = """
+    database_uids
+    DocumentJournal
+    read_journal
+    replay_journal
+""".split()
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+import datetime
+import glob
+import json
+import os
+import struct
+import threading
+import zlib
+
+import event_model
+
+DOCUMENT_NAMES = """
+    start descriptor event stop resource datum
+    event_page datum_page bulk_events bulk_datum
+    stream_resource stream_datum
+""".split()
+OTHER = 255  # code of any other document name (written in the payload)
+FRAME = struct.Struct("<2sBII")
+MAGIC = b"BJ"
+JOURNAL_DIR = os.path.join(os.getcwd(), ".journal")
+
+_open_files = set()  # journal files being written (not to be removed)
+
+
+class DocumentJournal:
+    """
+    append every ``(name, doc)`` to a local journal file
+
+    PARAMETERS
+
+    directory : str
+        where to write the journal files (default: ``.journal``)
+    max_bytes : int
+        start a new file when the current one is larger than this
+    max_total_bytes : int
+        (optional) most disk space for all journal files, the oldest
+        are removed (default: 10 files of ``max_bytes``)
+    fsync : str
+        when to force the file to disk: ``"stop"`` (end of each run,
+        default), ``"document"`` (slowest, safest), or ``"never"``
+    """
+
+    def __init__(
+        self,
+        directory=None,
+        max_bytes=100 * 2 ** 20,
+        fsync="stop",
+        max_total_bytes=None,
+    ):
+        if fsync not in ("stop", "document", "never"):
+            raise ValueError(f"unknown fsync policy: {fsync}")
+        self.directory = directory or JOURNAL_DIR
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes or 10 * max_bytes
+        self.fsync = fsync
+        self._file = None
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._limit_total_size()
+
+    @property
+    def filename(self):
+        """name of the current journal file (None if not open)"""
+        return None if self._file is None else self._file.name
+
+    def _limit_total_size(self):
+        """remove the oldest files, leave room for a new one to grow"""
+        files = [
+            f
+            for f in _journal_files(self.directory)
+            if os.path.abspath(f) not in _open_files
+        ]
+        sizes = {f: os.path.getsize(f) for f in files}
+        total = sum(sizes.values())
+        for oldest in files:  # the names sort oldest first
+            if total <= self.max_total_bytes - self.max_bytes:
+                break
+            os.remove(oldest)
+            total -= sizes[oldest]
+            logger.warning(
+                "document journal over %d bytes, removed: %s",
+                self.max_total_bytes,
+                oldest,
+            )
+
+    def _open(self):
+        self._limit_total_size()
+        ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        base = os.path.join(self.directory, f"journal-{ts}")
+        n = 0
+        while os.path.exists(f"{base}-{n:03d}.bdj"):
+            n += 1
+        filename = f"{base}-{n:03d}.bdj"
+        self._file = open(filename, "ab")
+        _open_files.add(os.path.abspath(filename))
+        logger.info("document journal: %s", filename)
+
+    def __call__(self, name, doc):
+        if name in DOCUMENT_NAMES:
+            code = DOCUMENT_NAMES.index(name)
+        else:
+            code, doc = OTHER, [name, doc]
+        payload = json.dumps(
+            doc, cls=event_model.NumpyEncoder, separators=(",", ":")
+        ).encode()
+        header = FRAME.pack(MAGIC, code, len(payload), zlib.crc32(payload))
+        with self._lock:
+            if self._file is None or self._file.tell() > self.max_bytes:
+                self.close()
+                self._open()
+            self._file.write(header + payload)
+            self._file.flush()  # hand over to the OS now
+            if self.fsync == "document" or (
+                self.fsync == "stop" and name == "stop"
+            ):
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        """close the current journal file"""
+        if self._file is not None:
+            if self.fsync != "never":
+                os.fsync(self._file.fileno())
+            self._file.close()
+            _open_files.discard(os.path.abspath(self._file.name))
+            self._file = None
+
+
+def _journal_files(path):
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "journal-*.bdj")))
+    return [path]
+
+
+def _read_file(filename, damaged):
+    """generate ``(name, doc)`` of one file, add it to damaged if bad"""
+    with open(filename, "rb") as f:
+        while True:
+            header = f.read(FRAME.size)
+            if len(header) == 0:
+                break
+            if len(header) < FRAME.size:
+                logger.warning("%s: incomplete frame at end", filename)
+                damaged.add(filename)
+                break
+            magic, code, length, crc = FRAME.unpack(header)
+            payload = f.read(length)
+            if (
+                magic != MAGIC
+                or len(payload) != length
+                or zlib.crc32(payload) != crc
+            ):
+                logger.warning(
+                    "%s: bad or incomplete frame at byte %d,"
+                    " rest of file skipped",
+                    filename,
+                    f.tell() - len(payload) - FRAME.size,
+                )
+                damaged.add(filename)
+                break
+            if code == OTHER:
+                yield tuple(json.loads(payload))
+            elif code < len(DOCUMENT_NAMES):
+                yield DOCUMENT_NAMES[code], json.loads(payload)
+            else:
+                logger.warning(
+                    "%s: unknown document code %d, skipped", filename, code
+                )
+
+
+def read_journal(path=None):
+    """
+    generate the ``(name, doc)`` pairs from a journal file or directory
+
+    Files of a directory are read in order (oldest first).
+    """
+    for filename in _journal_files(path or JOURNAL_DIR):
+        yield from _read_file(filename, set())
+
+
+def _run_uid(name, doc, runs):
+    """uid of the run that document belongs to, remember new references"""
+    if name == "start":
+        return doc["uid"]
+    if name == "stop":
+        return doc["run_start"]
+    if name == "descriptor":
+        runs[doc["uid"]] = doc["run_start"]
+        return doc["run_start"]
+    if name in ("resource", "stream_resource"):
+        runs[doc["uid"]] = doc.get("run_start")
+        return doc.get("run_start")
+    if name in ("event", "event_page"):
+        return runs.get(doc["descriptor"])
+    if name in ("datum", "datum_page"):
+        return runs.get(doc["resource"])
+    if name == "stream_datum":
+        return runs.get(doc.get("stream_resource"))
+    return None
+
+
+def _document_uids(name, doc):
+    """uids of a document (datum_id of datums, all those of a page)"""
+    if name in ("datum", "datum_page"):
+        uids = doc.get("datum_id")
+    else:
+        uids = doc.get("uid")
+    if uids is None:
+        return []
+    return list(uids) if isinstance(uids, list) else [uids]
+
+
+def database_uids(db):
+    """
+    make ``stored(run_uid)`` for :func:`replay_journal` from a databroker
+
+    ``stored(run_uid)`` returns the uids of the documents of the run
+    that are in ``db`` (empty if the run is not there).
+    """
+
+    def stored(run_uid):
+        try:
+            run = db[run_uid]
+        except (KeyError, ValueError):
+            return set()
+        return {
+            uid
+            for name, doc in run.documents(fill=False)
+            for uid in _document_uids(name, doc)
+        }
+
+    return stored
+
+
+def replay_journal(insert, path=None, stored=None, remove=False):
+    """
+    insert the journaled documents the database does not have
+
+    PARAMETERS
+
+    insert : callable
+        ``insert(name, doc)``, such as ``db.insert``
+    path : str
+        journal file or directory (default: ``.journal``)
+    stored : callable
+        (optional) ``stored(run_uid)`` returns the uids of the documents
+        of the run that are in the database already (these are
+        skipped), such as ``database_uids(db)``
+    remove : bool
+        after a replay without errors, delete the journal files read,
+        except those being written or with a run that has not stopped
+
+    Returns the number of documents inserted.
+    """
+    runs = {}  # descriptor or resource uid: run uid
+    in_database = {}  # run uid: uids of its documents in the database
+    run_files = {}  # run uid: journal files with its documents
+    stopped = set()  # run uids with a stop document
+    damaged = set()  # files not read to the end
+    files = _journal_files(path or JOURNAL_DIR)
+    count = skipped = errors = 0
+    for filename in files:
+        for name, doc in _read_file(filename, damaged):
+            uid = _run_uid(name, doc, runs)
+            run_files.setdefault(uid, set()).add(filename)
+            if name == "stop":
+                stopped.add(uid)
+            if stored is not None and uid is not None:
+                if uid not in in_database:
+                    in_database[uid] = set(stored(uid))
+                uids = _document_uids(name, doc)
+                if len(uids) > 0 and in_database[uid].issuperset(uids):
+                    skipped += 1
+                    continue
+            try:
+                insert(name, doc)
+                count += 1
+            except Exception as exc:
+                errors += 1
+                logger.warning(
+                    "replay %s %s: %s", name, _document_uids(name, doc), exc
+                )
+    logger.info(
+        "replayed %d documents, %d in the database already, %d errors",
+        count,
+        skipped,
+        errors,
+    )
+
+    if remove and errors == 0 and len(damaged) == 0:
+        keep = set()  # files of runs that have not stopped (yet)
+        for uid, names in run_files.items():
+            if uid is not None and uid not in stopped:
+                keep.update(names)
+        for filename in files:
+            if filename in keep or os.path.abspath(filename) in _open_files:
+                continue
+            os.remove(filename)
+            logger.info("removed replayed journal file: %s", filename)
+    return count
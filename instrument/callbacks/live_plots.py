@@ -0,0 +1,256 @@
+"""
+rate-limited live plots for the BestEffortCallback
+
+``BestEffortCallback`` redraws each of its live plots after every
+event, so a fast scan spends most of its time drawing, more with each
+figure open.  :class:`ThrottledBestEffortCallback` draws all of its live
+plots together, at most ``max_refresh_rate`` times per second:
+
+* a line with more than ``max_points`` points is drawn decimated
+  (the smallest and largest value of each group of points),
+* when the new points fit in the axes, only the line is redrawn
+  (blitting, if the canvas supports it), the axes limits have some
+  headroom so this is the usual case,
+* at ``stop``, each plot is redrawn in full, with all of its data.
+
+The LivePlot keeps all the data, only the drawing is reduced.
+
+Figures are reused for the same plot, so each run adds a line (curve)
+to the axes.  With ``max_curves``, the oldest lines of the axes are
+removed when a new run starts to draw, so memory and redraw time stay
+the same, however many runs are plotted.
+
+EXAMPLE::
+
+    bec = ThrottledBestEffortCallback(max_refresh_rate=5, max_curves=5)
+    RE.subscribe(bec)
+"""
+
+__all__ = [
+    "ThrottledBestEffortCallback",
+    "decimate",
+]
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+from bluesky.callbacks.best_effort import BestEffortCallback
+import numpy as np
+import threading
+import time
+
+MAX_REFRESH_RATE = 5  # redraws per second, all live plots together
+MAX_POINTS = 2000  # most points drawn per line while the run is active
+HEADROOM = 0.1  # fraction of the data range added around the axes limits
+MAX_CURVES = None  # most lines kept per axes (None: no limit)
+
+
+def decimate(x, y, max_points=MAX_POINTS):
+    """
+    at most ``max_points`` of ``(x, y)``: the min & max ``y`` of each group
+
+    Keeps the order of the points and the extremes of the data, so peaks
+    are still seen.  Returns numpy arrays.
+    """
+    n = min(len(x), len(y))
+    x = np.asarray(x[:n], dtype=float)
+    y = np.asarray(y[:n], dtype=float)
+    if n <= max_points:
+        return x, y
+    groups = max(max_points // 2, 1)
+    size = -(-n // groups)  # points per group, rounded up
+    rows = -(-n // size)
+    padded = np.full(rows * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(rows, size)
+    nan = np.isnan(padded)
+    lo = np.where(nan, np.inf, padded).argmin(axis=1)
+    hi = np.where(nan, -np.inf, padded).argmax(axis=1)
+    start = np.arange(rows) * size
+    index = np.stack(
+        [start + np.minimum(lo, hi), start + np.maximum(lo, hi)], axis=1
+    ).ravel()
+    index = index[index < n]
+    return x[index], y[index]
+
+
+def _with_headroom(low, high):
+    span = (high - low) or abs(high) or 1
+    return low - HEADROOM * span, high + HEADROOM * span
+
+
+class _PlotThrottle:
+    """draws one LivePlot, decimated and blitted"""
+
+    def __init__(self, live_plot, max_points, max_curves):
+        self.live_plot = live_plot
+        self.max_points = max_points
+        self.max_curves = max_curves
+        self.dirty = False
+        self._background = None
+        self._canvas = None
+        self._cid = None
+        self._line = None
+
+    def _connect(self):
+        """(once the LivePlot has its axes & line) prepare to blit"""
+        line = getattr(self.live_plot, "current_line", None)
+        if line is None or line is self._line:
+            return
+        self._line = line
+        self._remove_old_lines()
+        canvas = self.live_plot.ax.figure.canvas
+        if getattr(canvas, "supports_blit", False):
+            line.set_animated(True)  # drawn by us, not in the background
+            self._canvas = canvas
+            self._cid = canvas.mpl_connect("draw_event", self._on_draw)
+
+    def _remove_old_lines(self):
+        """keep the newest ``max_curves`` lines of the axes"""
+        ax = self.live_plot.ax
+        if self.max_curves is None or len(ax.lines) <= self.max_curves:
+            return
+        old = [line for line in ax.lines if line is not self._line]
+        for line in old[: len(ax.lines) - max(self.max_curves, 1)]:
+            line.remove()
+        ax.legend(loc=0, title=getattr(self.live_plot, "legend_title", None))
+
+    def _on_draw(self, event):
+        """full redraw done: save the background, draw the line on it"""
+        ax = self.live_plot.ax
+        self._background = self._canvas.copy_from_bbox(ax.bbox)
+        ax.draw_artist(self._line)
+
+    def _fits(self, x, y):
+        ax = self.live_plot.ax
+        finite = np.isfinite(x) & np.isfinite(y)
+        if not finite.any():
+            return True
+        x, y = x[finite], y[finite]
+        x_lo, x_hi = sorted(ax.get_xlim())
+        y_lo, y_hi = sorted(ax.get_ylim())
+        return (
+            x_lo <= x.min()
+            and x.max() <= x_hi
+            and y_lo <= y.min()
+            and y.max() <= y_hi
+        )
+
+    def refresh(self):
+        self.dirty = False
+        self._connect()
+        if self._line is None:
+            return
+        x, y = decimate(
+            self.live_plot.x_data, self.live_plot.y_data, self.max_points
+        )
+        self._line.set_data(x, y)
+        ax = self.live_plot.ax
+        if self._background is not None and self._fits(x, y):
+            self._canvas.restore_region(self._background)
+            ax.draw_artist(self._line)
+            self._canvas.blit(ax.bbox)
+        else:
+            ax.relim(visible_only=True)
+            ax.autoscale_view(tight=True)
+            if len(x) > 1:
+                ax.set_xlim(*_with_headroom(*ax.get_xlim()))
+                ax.set_ylim(*_with_headroom(*ax.get_ylim()))
+            self._background = None  # saved again at the redraw
+            ax.figure.canvas.draw_idle()
+
+    def finish(self):
+        """stop throttling, redraw with all the data"""
+        self._connect()  # in case no event was plotted
+        if self._cid is not None:
+            self._canvas.mpl_disconnect(self._cid)
+            self._cid = None
+        if self._line is not None:
+            self._line.set_animated(False)
+        self._background = None
+        # restore the LivePlot's own methods, draw in full
+        for attr in ("update_plot", "stop"):
+            self.live_plot.__dict__.pop(attr, None)
+        self.live_plot.update_plot()
+
+
+class ThrottledBestEffortCallback(BestEffortCallback):
+    """
+    BestEffortCallback that limits how often (and how much) it draws
+
+    PARAMETERS
+
+    max_refresh_rate : float
+        most redraws per second, of all the live plots together
+        (``None``: redraw after each event)
+    max_points : int
+        most points drawn per line until the run stops
+    max_curves : int
+        most lines (curves) kept per axes, the oldest are removed
+        when a new run is plotted (``None``: no limit)
+
+    Other arguments are passed to ``BestEffortCallback``.
+    """
+
+    def __init__(
+        self,
+        *args,
+        max_refresh_rate=MAX_REFRESH_RATE,
+        max_points=MAX_POINTS,
+        max_curves=MAX_CURVES,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.max_refresh_rate = max_refresh_rate
+        self.max_points = max_points
+        self.max_curves = max_curves
+        self._throttles = []
+        self._last_refresh = 0
+        self._throttle_lock = threading.Lock()
+
+    def descriptor(self, doc):
+        super().descriptor(doc)
+        live_plots = getattr(self, "_live_plots", {}).get(doc["uid"], {})
+        for live_plot in live_plots.values():
+            self._throttle(live_plot)
+
+    def _throttle(self, live_plot):
+        """replace the LivePlot's update_plot() (just this instance)"""
+        throttle = _PlotThrottle(
+            live_plot, self.max_points, self.max_curves
+        )
+        original_stop = live_plot.stop
+
+        def update_plot():
+            throttle.dirty = True
+            self._refresh()
+
+        def stop(doc):
+            original_stop(doc)
+            with self._throttle_lock:
+                if throttle in self._throttles:
+                    self._throttles.remove(throttle)
+            throttle.finish()
+
+        # LivePlot calls these in its own (GUI) thread
+        live_plot.update_plot = update_plot
+        live_plot.stop = stop
+        with self._throttle_lock:
+            self._throttles.append(throttle)
+
+    def _refresh(self):
+        """redraw the changed plots, unless it is too soon"""
+        now = time.monotonic()
+        rate = self.max_refresh_rate
+        if rate and now - self._last_refresh < 1 / rate:
+            return  # drawn later (or at stop)
+        self._last_refresh = now
+        with self._throttle_lock:
+            throttles = list(self._throttles)
+        for throttle in throttles:
+            if throttle.dirty:
+                try:
+                    throttle.refresh()
+                except Exception as exc:
+                    logger.warning("live plot refresh: %s", exc)
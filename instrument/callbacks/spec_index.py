@@ -0,0 +1,265 @@
+"""
+scan index sidecar for SPEC data files
+
+Next to each SPEC data file (``mmdd_title.dat``), ``mmdd_title.dat.idx``
+holds the byte offset of each scan (``#S`` line, with its number) and
+of each file header (``#F`` line), and the epoch of the last header.
+The index is updated by reading only what was appended to the data
+file since the last update, so opening a data file with tens of
+thousands of scans, finding the next scan number, and reading one scan
+do not read the whole file.
+
+The index file is a fixed-size header, then fixed-size records::
+
+    header: magic (b"SPIX"), version, records, scans, highest scan
+            number, latest epoch, bytes of the data file indexed
+    record: kind (b"S" scan or b"F" file header), scan number (0 for
+            a file header), byte offset of the line
+
+The index is rebuilt if it does not match the data file (such as a data
+file that was replaced, edited, or truncated).  A read-only index
+(``readonly=True``, as :func:`read_spec_scan`) keeps what it indexes
+in memory and never writes the index file.
+
+EXAMPLE::
+
+    index = SpecScanIndex("10_18_tune.dat")
+    index.highest           # highest scan number in the file
+    print(index.read_scan(42))
+"""
+
+__all__ = """
+    SpecScanIndex
+    read_spec_scan
+""".split()
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+import os
+import struct
+
+HEADER = struct.Struct("<4sHQQqqQ")
+RECORD = struct.Struct("<cqQ")
+MAGIC = b"SPIX"
+VERSION = 1
+
+
+class SpecScanIndex:
+    """
+    index of the scans in SPEC data file ``spec_filename``
+
+    PARAMETERS
+
+    spec_filename : str
+        the SPEC data file (need not exist yet)
+    readonly : bool
+        (optional) if True, do not write the index file
+    """
+
+    def __init__(self, spec_filename, readonly=False):
+        self.spec_filename = os.path.abspath(spec_filename)
+        self.filename = self.spec_filename + ".idx"
+        self.readonly = readonly
+        self.records = 0  # records indexed
+        self.scans = 0  # scans (#S lines) indexed
+        self.highest = 0  # highest scan number
+        self.epoch = None  # epoch of the last file header (#E)
+        self.indexed_size = 0  # bytes of the data file indexed
+        self._positions = None  # {scan number: record}, read when needed
+        self._stored = 0  # records in the index file
+        self._unsaved = []  # (readonly) records after those
+        self._last = None  # (kind, offset) of the last record
+        if not self._load():
+            self._reset()
+        self.update()
+
+    def _load(self):
+        """read the index header, True if it matches the data file"""
+        if not os.path.exists(self.filename):
+            return False
+        try:
+            with open(self.filename, "rb") as f:
+                header = f.read(HEADER.size)
+                (
+                    magic,
+                    version,
+                    self.records,
+                    self.scans,
+                    self.highest,
+                    epoch,
+                    self.indexed_size,
+                ) = HEADER.unpack(header)
+                if magic != MAGIC or version != VERSION:
+                    return False
+                self.epoch = None if epoch < 0 else epoch
+                if self.records == 0:
+                    return self.indexed_size == 0
+                f.seek(HEADER.size + (self.records - 1) * RECORD.size)
+                kind, number, offset = RECORD.unpack(f.read(RECORD.size))
+        except (OSError, struct.error) as exc:
+            logger.warning("%s: %s, rebuilding", self.filename, exc)
+            return False
+        self._stored = self.records
+        self._last = kind, offset
+        return self._matches()
+
+    def _matches(self):
+        """True if the data file still has the lines indexed"""
+        try:
+            if os.path.getsize(self.spec_filename) < self.indexed_size:
+                return False  # truncated
+            if self._last is None:
+                return True
+            # the last indexed line must still be where the index says
+            kind, offset = self._last
+            expected = b"#" + kind + b" "
+            with open(self.spec_filename, "rb") as f:
+                f.seek(offset)
+                return f.read(len(expected)) == expected
+        except OSError:
+            return False
+
+    def _reset(self):
+        """start an empty index"""
+        self.records = self.scans = self.highest = self.indexed_size = 0
+        self.epoch = None
+        self._positions = None
+        self._stored = 0
+        self._unsaved = []
+        self._last = None
+        if not self.readonly:
+            with open(self.filename, "wb") as f:
+                f.write(self._header())
+
+    def _header(self):
+        epoch = -1 if self.epoch is None else self.epoch
+        return HEADER.pack(
+            MAGIC,
+            VERSION,
+            self.records,
+            self.scans,
+            self.highest,
+            epoch,
+            self.indexed_size,
+        )
+
+    def update(self):
+        """index the lines appended to the data file since the last time"""
+        if not os.path.exists(self.spec_filename):
+            return 0
+        if not self._matches():
+            logger.warning(
+                "%s changed since it was indexed, rebuilding the index",
+                self.spec_filename,
+            )
+            self._reset()
+        with open(self.spec_filename, "rb") as f:
+            f.seek(self.indexed_size)
+            buf = f.read()
+        end = buf.rfind(b"\n") + 1  # index complete lines only
+        if end == 0:
+            return 0
+
+        records = []
+        position = 0
+        while position < end:
+            eol = buf.index(b"\n", position) + 1
+            line = buf[position:eol]
+            offset = self.indexed_size + position
+            if line.startswith(b"#S "):
+                try:
+                    number = int(float(line.split()[1]))
+                except (IndexError, ValueError):
+                    number = self.highest + 1
+                if self._positions is not None:
+                    self._positions[number] = self.records + len(records)
+                records.append((b"S", number, offset))
+                self.scans += 1
+                self.highest = max(self.highest, number)
+            elif line.startswith(b"#F "):
+                records.append((b"F", 0, offset))
+            elif line.startswith(b"#E "):
+                try:
+                    self.epoch = int(line.split()[1])
+                except (IndexError, ValueError):
+                    pass
+            position = eol
+
+        self.records += len(records)
+        self.indexed_size += end
+        if len(records) > 0:
+            self._last = records[-1][0], records[-1][2]
+        if self.readonly:
+            self._unsaved += records
+            return len(records)
+        with open(self.filename, "r+b") as f:
+            # records first, then the header that counts them
+            f.seek(HEADER.size + self._stored * RECORD.size)
+            f.write(b"".join(RECORD.pack(*r) for r in records))
+            f.truncate()
+            f.seek(0)
+            f.write(self._header())
+        self._stored = self.records
+        return len(records)
+
+    def _read_records(self, first=0, count=None):
+        """records ``first`` to ``first + count`` of the index"""
+        if count is None:
+            count = self.records - first
+        last = max(first, min(first + count, self.records))
+        records = []
+        stored = min(last, self._stored)
+        if first < stored:
+            with open(self.filename, "rb") as f:
+                f.seek(HEADER.size + first * RECORD.size)
+                buf = f.read((stored - first) * RECORD.size)
+            records = [
+                RECORD.unpack_from(buf, i * RECORD.size)
+                for i in range(len(buf) // RECORD.size)
+            ]
+        unsaved = max(first, self._stored) - self._stored
+        return records + self._unsaved[unsaved : last - self._stored]
+
+    def scan_numbers(self):
+        """the scan numbers in the file"""
+        return list(self._scan_positions())
+
+    def _scan_positions(self):
+        """``{scan number: record number}`` (the last scan of a number)"""
+        if self._positions is None:
+            self._positions = {
+                number: i
+                for i, (kind, number, offset) in enumerate(
+                    self._read_records()
+                )
+                if kind == b"S"
+            }
+        return self._positions
+
+    @property
+    def next_scan_id(self):
+        """scan_id for RE.md, so the next scan number follows the file"""
+        return max(self.scans, self.highest)
+
+    def read_scan(self, scan_number):
+        """text of scan ``scan_number`` (from #S to the next #S or #F)"""
+        position = self._scan_positions().get(scan_number)
+        if position is None:
+            raise KeyError(f"scan {scan_number} not in {self.spec_filename}")
+        records = self._read_records(position, 2)
+        offset = records[0][2]
+        end = records[1][2] if len(records) > 1 else self.indexed_size
+        with open(self.spec_filename, "rb") as f:
+            f.seek(offset)
+            return f.read(end - offset).decode().rstrip() + "\n"
+
+
+def read_spec_scan(spec_filename, scan_number):
+    """
+    text of scan ``scan_number`` of a SPEC data file
+
+    Uses the index file if it is there, but does not write it.
+    """
+    return SpecScanIndex(spec_filename, readonly=True).read_scan(scan_number)
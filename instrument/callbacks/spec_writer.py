@@ -0,0 +1,255 @@
+"""
+SPEC data file writer that appends each data row as its event arrives
+
+``apstools.filewriters.SpecWriterCallback`` keeps all the data of a
+scan in memory and writes the scan when it ends.  The
+:class:`StreamingSpecWriterCallback` writes the scan header (through
+the ``#L`` line) at the first ``primary`` event, then appends one row
+per event (and forgets it), then the comments at ``stop``.  Memory
+stays bounded by the file buffer, and the ``.dat`` file can be followed
+(``tail -f``) while the scan runs.
+
+The scan is written as ``SpecWriterCallback`` would.  A scan without
+data is written at stop, as before.  This subclass uses the scan data
+of ``SpecWriterCallback`` (``data``, ``num_primary_data``,
+``comments``), the reason ``setup.py`` pins the apstools version.
+
+After each scan, the scan index sidecar (``.dat.idx``, see
+:class:`~instrument.callbacks.SpecScanIndex`) is updated.  With it,
+``newfile()`` of an existing data file finds the next scan number
+without reading the whole file.
+
+EXAMPLE::
+
+    specwriter = StreamingSpecWriterCallback(flush="interval")
+    RE.subscribe(specwriter.receiver)
+"""
+
+__all__ = [
+    "StreamingSpecWriterCallback",
+]
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+from apstools.filewriters import SpecWriterCallback
+import getpass
+import mmap
+import os
+import socket
+import threading
+import time
+
+from .spec_index import SpecScanIndex
+
+FLUSH_POLICIES = ("event", "interval", "stop")
+FSYNC_POLICIES = ("stop", "flush", "never")
+
+
+class StreamingSpecWriterCallback(SpecWriterCallback):
+    """
+    SpecWriterCallback that writes each data row as its event arrives
+
+    PARAMETERS
+
+    flush : str
+        when to hand the buffered rows to the OS: ``"event"`` (each row),
+        ``"interval"`` (within ``flush_interval``, default), or ``"stop"``
+    flush_interval : float
+        longest time (seconds) a row stays in the buffer (``"interval"``)
+    fsync : str
+        when to force the file to disk: ``"stop"`` (default),
+        ``"flush"`` (at each flush), or ``"never"``
+    buffer_size : int
+        file buffer size (bytes)
+
+    Other arguments are passed to ``SpecWriterCallback``.
+    """
+
+    def __init__(
+        self,
+        *args,
+        flush="interval",
+        flush_interval=1.0,
+        fsync="stop",
+        buffer_size=64 * 1024,
+        **kwargs,
+    ):
+        if flush not in FLUSH_POLICIES:
+            raise ValueError(f"unknown flush policy: {flush}")
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"unknown fsync policy: {fsync}")
+        self.flush_policy = flush
+        self.flush_interval = flush_interval
+        self.fsync_policy = fsync
+        self.buffer_size = buffer_size
+        self._file = None  # open while a scan is streamed
+        self._timer = None
+        self._lock = threading.RLock()
+        self.index = None  # SpecScanIndex of the data file
+        super().__init__(*args, **kwargs)
+
+    def newfile(self, filename=None, scan_id=None, RE=None):
+        """
+        use SPEC data file ``filename``, an existing file is appended
+
+        The scan index of an existing file gives its highest scan
+        number (instead of reading the file), as ``SpecWriterCallback``.
+        """
+        if filename is None or not os.path.exists(filename):
+            self.index = None
+            return super().newfile(filename, scan_id=scan_id, RE=RE)
+
+        self.clear()
+        self.index = SpecScanIndex(filename)
+        self.spec_filename = filename
+        self.spec_epoch = int(time.time())
+        self.spec_host = socket.gethostname() or "localhost"
+        self.spec_user = getpass.getuser() or "BlueSkyUser"
+        self.write_file_header = True  # a new header block, as SPEC does
+        if isinstance(scan_id, bool):
+            # True: reset the scan ID, False: do not modify it
+            scan_id = {True: 1, False: None}[scan_id]
+        scan_id = max(scan_id or 0, self.index.next_scan_id)
+        if RE is not None:
+            RE.md["scan_id"] = scan_id
+            self.scan_id = scan_id
+        return self.spec_filename
+
+    def _update_index(self):
+        """index the scan just written"""
+        try:
+            if (
+                self.index is None
+                or self.index.spec_filename
+                != os.path.abspath(self.spec_filename)
+            ):
+                self.index = SpecScanIndex(self.spec_filename)
+            else:
+                self.index.update()
+        except Exception as exc:
+            logger.warning("SPEC scan index not updated: %s", exc)
+
+    def start(self, doc):
+        self._close()  # in case the last scan did not stop
+        super().start(doc)
+
+    def event(self, doc):
+        rows = self.num_primary_data
+        super().event(doc)
+        if self.num_primary_data == rows or self.spec_filename is None:
+            return  # not a row of data
+        with self._lock:
+            if self._file is None and not self._begin_scan():
+                return  # no data columns: written at stop, as before
+            self._write(self._row_lines(self.num_primary_data - 1))
+            for values in self.data.values():
+                values.clear()
+            self._written()
+
+    def write_scan(self):
+        """(at stop) write the rest of the scan, or all of it"""
+        with self._lock:
+            if self._file is None:
+                super().write_scan()
+            else:
+                # the comments after the data, as prepare_scan_contents()
+                self._write(
+                    "#C " + v
+                    for part in ("event", "resource", "datum", "stop")
+                    for v in self.comments[part]
+                )
+                self._close()
+                logger.info(
+                    "wrote scan %d to SPEC file: %s",
+                    self.scan_id,
+                    self.spec_filename,
+                )
+                self.clear()
+        if self.spec_filename is not None:
+            self._update_index()
+
+    def _scan_header(self):
+        """scan lines through ``#L``, None if there are no data columns"""
+        rows, self.num_primary_data = self.num_primary_data, 0
+        try:
+            lines = self.prepare_scan_contents()
+        finally:
+            self.num_primary_data = rows
+        labels = [i for i, line in enumerate(lines) if line.startswith("#L ")]
+        if len(labels) == 0:
+            return None
+        return lines[: labels[0] + 1]
+
+    def _begin_scan(self):
+        """open the file, write the headers, True if streaming this scan"""
+        lines = self._scan_header()
+        if lines is None:
+            return False
+        self._check_uid()
+        if self.write_file_header:
+            self.write_header()  # writes the file header, as write_scan()
+            logger.info("wrote header to SPEC file: %s", self.spec_filename)
+        self._file = open(self.spec_filename, "a", buffering=self.buffer_size)
+        self._write(lines)
+        return True
+
+    def _check_uid(self):
+        """raise ValueError if the file has this scan (as write_scan())"""
+        if not os.path.exists(self.spec_filename):
+            return
+        with open(self.spec_filename, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                found = buf.find(self.uid.encode()) >= 0
+        if found:
+            raise ValueError(
+                f"{self.spec_filename} already contains uid={self.uid}"
+            )
+
+    def _row_lines(self, row):
+        """the data row (and a #U line for each text value)"""
+        values, text = [], []
+        for key, data in self.data.items():
+            datum = data[-1]
+            if isinstance(datum, str):
+                # SPEC data are numbers: write the row number instead
+                text.append(f"#U {row} {key} {datum}")
+                datum = row
+            values.append(str(datum))
+        return [" ".join(values)] + text
+
+    def _write(self, lines):
+        self._file.writelines(line + "\n" for line in lines)
+
+    def _written(self):
+        """rows were written: flush as the policy says"""
+        if self.flush_policy == "event":
+            self.flush()
+        elif self.flush_policy == "interval" and self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """write the buffered rows to the file now"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._file is not None:
+                self._file.flush()
+                if self.fsync_policy == "flush":
+                    os.fsync(self._file.fileno())
+
+    def _close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self.flush()
+            if self.fsync_policy != "never":
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
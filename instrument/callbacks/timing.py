@@ -0,0 +1,204 @@
+"""
+callback timing: latency histograms per callback and document type
+
+A :class:`TimedCallback` wraps a RunEngine subscriber and measures each
+call.  Latencies are counted in a histogram with power-of-two bins
+(microseconds), per document name, so the overhead is two clock reads
+and a few integer operations per document.
+
+At the end of each run, the time spent in each callback during that run
+is logged (printed too, with ``SHOW_RUN_SUMMARY``).  Queued callbacks
+might still be busy at stop: documents they handle later are missing
+from that summary (not from the totals).  At any time::
+
+    callback_stats()        # since the session started (or the reset)
+    reset_callback_stats()
+
+Use this to find the callbacks that slow a scan down.
+"""
+
+__all__ = """
+    TimedCallback
+    callback_stats
+    reset_callback_stats
+    run_summary_callback
+""".split()
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+import threading
+import time
+
+import pyRestTable
+
+NUM_BINS = 40  # bin i: latency < 2**i microseconds
+SHOW_RUN_SUMMARY = False
+
+_timers = {}  # name: TimedCallback
+
+
+class LatencyHistogram:
+    """count of latencies in power-of-two bins (microseconds)"""
+
+    def __init__(self):
+        self.bins = [0] * NUM_BINS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, dt):
+        self.bins[min(int(dt * 1e6).bit_length(), NUM_BINS - 1)] += 1
+        self.count += 1
+        self.total += dt
+        if dt > self.max:
+            self.max = dt
+
+    def copy(self):
+        other = LatencyHistogram()
+        other.bins = list(self.bins)
+        other.count = self.count
+        other.total = self.total
+        other.max = self.max
+        return other
+
+    def since(self, earlier):
+        """histogram of the latencies added after ``earlier`` (a copy)"""
+        other = LatencyHistogram()
+        other.bins = [a - b for a, b in zip(self.bins, earlier.bins)]
+        other.count = self.count - earlier.count
+        other.total = self.total - earlier.total
+        other.max = self.max  # best available
+        return other
+
+    def percentile(self, p):
+        """upper bound (s) of the latency at percentile ``p`` (0..100)"""
+        if self.count == 0:
+            return 0.0
+        target = self.count * p / 100
+        cumulative = 0
+        for i, n in enumerate(self.bins):
+            cumulative += n
+            if n > 0 and cumulative >= target:
+                return min(2 ** i * 1e-6, self.max)
+        return self.max
+
+
+class TimedCallback:
+    """
+    call ``callback(name, doc)`` and record how long it took
+
+    PARAMETERS
+
+    callback : callable
+        the subscriber, ``callback(name, doc)``
+    name : str
+        name of this subscriber (as in ``callback_stats()``)
+    """
+
+    def __init__(self, callback, name=None):
+        self.callback = callback
+        self.name = name or getattr(callback, "__name__", str(callback))
+        self.histograms = {}  # document name: LatencyHistogram
+        self._lock = threading.Lock()
+        _timers[self.name] = self
+
+    def __call__(self, name, doc):
+        t0 = time.perf_counter()
+        try:
+            return self.callback(name, doc)
+        finally:
+            dt = time.perf_counter() - t0
+            with self._lock:
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = self.histograms[name] = LatencyHistogram()
+                histogram.add(dt)
+
+    def snapshot(self):
+        """copy of the histograms"""
+        with self._lock:
+            return {k: v.copy() for k, v in self.histograms.items()}
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+
+def _stats_table(histograms):
+    """table from ``{(callback, document): LatencyHistogram}``"""
+    table = pyRestTable.Table()
+    table.labels = (
+        "callback document count total_s mean_ms p50_ms p99_ms max_ms"
+    ).split()
+    for (callback, document), h in sorted(histograms.items()):
+        if h.count == 0:
+            continue
+        table.addRow(
+            (
+                callback,
+                document,
+                h.count,
+                f"{h.total:.3f}",
+                f"{1e3 * h.total / h.count:.3f}",
+                f"{1e3 * h.percentile(50):.3f}",
+                f"{1e3 * h.percentile(99):.3f}",
+                f"{1e3 * h.max:.3f}",
+            )
+        )
+    return table
+
+
+def callback_stats(show=True):
+    """
+    table of the callback latencies, per callback and document type
+
+    Percentiles are the upper bounds of the histogram bins.
+    """
+    histograms = {}
+    for name, timer in _timers.items():
+        for document, h in timer.snapshot().items():
+            histograms[(name, document)] = h
+    table = _stats_table(histograms)
+    if show:
+        print(table)
+    return table
+
+
+def reset_callback_stats():
+    """forget all recorded callback latencies"""
+    for timer in _timers.values():
+        timer.reset()
+
+
+class _RunSummary:
+    """at each stop, report the callback latencies of that run"""
+
+    def __init__(self):
+        self._at_start = {}
+
+    def __call__(self, name, doc):
+        if name == "start":
+            self._at_start = {k: t.snapshot() for k, t in _timers.items()}
+        elif name == "stop":
+            histograms = {}
+            for key, timer in _timers.items():
+                before = self._at_start.get(key, {})
+                for document, h in timer.snapshot().items():
+                    if document in before:
+                        h = h.since(before[document])
+                    histograms[(key, document)] = h
+            table = _stats_table(histograms)
+            total = sum(h.total for h in histograms.values())
+            logger.info(
+                "callback time in run %s: %.3f s\n%s",
+                doc.get("run_start", "")[:8],
+                total,
+                table,
+            )
+            if SHOW_RUN_SUMMARY:
+                print(table)
+
+
+run_summary_callback = _RunSummary()
@@ -2,6 +2,10 @@
 configure for data collection in a console session
 """
 
+from .startup_profile import startup_profiler
+
+startup_profiler.start()
+
 from .session_logs import logger
 
 logger.info(__file__)
@@ -19,6 +23,11 @@ from .callbacks import *
 from .plans import *
 from .utils import *
 
+# build & connect all devices now, in parallel (otherwise, on first use)
+# connect_devices(timeout=10)
+
 from apstools.utils import *
 
 from .session_logs import logger
+
+startup_profiler.finish()
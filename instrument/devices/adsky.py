@@ -28,6 +28,9 @@ from ophyd.areadetector import SimDetectorCam
 from ophyd.areadetector import SingleTrigger
 from ophyd.areadetector.filestore_mixins import FileStoreHDF5IterativeWrite
 
+from ..utils.ioc_state import declare_ioc_value
+from ..utils.lazy_devices import lazy_device
+
 ioc_name = "adsky"
 _ad_prefix = f"{ioc_name}:"
 
@@ -89,21 +92,29 @@ class MySingleTriggerSimDetector(SingleTrigger, SimDetector):
     image = ADComponent(MyImagePlugin, suffix="image1:")
 
 
-adsimdet = MySingleTriggerSimDetector(_ad_prefix, name="adsimdet")
-adsimdet.wait_for_connection()
-adsimdet.stage_sigs["cam.num_images"] = 1
-adsimdet.stage_sigs["cam.acquire_time"] = 0.01
-adsimdet.stage_sigs["cam.acquire_period"] = 0.02
-adsimdet.hdf1.stage_sigs["num_capture"] = 1
+def _setup_adsimdet(adsimdet):
+    adsimdet.stage_sigs["cam.num_images"] = 1
+    adsimdet.stage_sigs["cam.acquire_time"] = 0.01
+    adsimdet.stage_sigs["cam.acquire_period"] = 0.02
+    adsimdet.hdf1.stage_sigs["num_capture"] = 1
+
+    adsimdet.read_attrs.append("hdf1")
+    if adsimdet.hdf1.create_directory_depth.get() == 0:
+        # probably not set, so let's set it now to some default
+        declare_ioc_value(adsimdet.hdf1.create_directory_depth, -5)
+
+    enabled = adsimdet.hdf1.enable.get()
+    adsimdet.hdf1.warmup()
+    adsimdet.hdf1.enable.put(enabled)
 
-adsimdet.read_attrs.append("hdf1")
-if adsimdet.hdf1.create_directory_depth.get() == 0:
-    # probably not set, so let's set it now to some default
-    adsimdet.hdf1.create_directory_depth.put(-5)
 
-enabled = adsimdet.hdf1.enable.get()
-adsimdet.hdf1.warmup()
-adsimdet.hdf1.enable.put(enabled)
+# connected on first use or by connect_devices(), with all the others
+adsimdet = lazy_device(
+    "adsimdet",
+    lambda: MySingleTriggerSimDetector(_ad_prefix, name="adsimdet"),
+    _setup_adsimdet,
+    ioc=_ad_prefix,
+)
 
 
 def shot(images=1, exposures=1, num=1, md={}):
@@ -1,12 +1,26 @@
 import apstools.synApps
 from ophyd import EpicsSignalRO
 from ..session_logs import logger
+from ..utils.ioc_state import declare_ioc_value
+from ..utils.lazy_devices import lazy_device
 
 logger.info(__file__)
 
 __all__ = ["calcs", "calcouts"]
 
-calcs = apstools.synApps.UserCalcsDevice("sky:", name="calcs")
-calcouts = apstools.synApps.UserCalcoutDevice("sky:", name="calcouts")
 
-calcs.enable.put(1)
+def _enable(device):
+    declare_ioc_value(device.enable, 1)
+
+
+calcs = lazy_device(
+    "calcs",
+    lambda: apstools.synApps.UserCalcsDevice("sky:", name="calcs"),
+    _enable,
+    ioc="sky:",
+)
+calcouts = lazy_device(
+    "calcouts",
+    lambda: apstools.synApps.UserCalcoutDevice("sky:", name="calcouts"),
+    ioc="sky:",
+)
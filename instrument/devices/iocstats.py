@@ -11,5 +11,8 @@ from ..session_logs import logger
 logger.info(__file__)
 
 from apstools.synApps import IocStatsDevice
+from ..utils.lazy_devices import lazy_device
 
-iocsky = IocStatsDevice("sky:", name="iocsky")
+iocsky = lazy_device(
+    "iocsky", lambda: IocStatsDevice("sky:", name="iocsky"), ioc="sky:"
+)
@@ -11,6 +11,8 @@ from ophyd import Device, Component, EpicsSignal, EpicsMotor
 
 from apstools.devices import EpicsMotorLimitsMixin
 from ..session_logs import logger
+from ..utils.ioc_state import declare_ioc_value
+from ..utils.lazy_devices import lazy_device
 
 logger.info(__file__)
 
@@ -20,16 +22,24 @@ class MyMotor(EpicsMotorLimitsMixin, EpicsMotor):
     steps_per_rev = Component(EpicsSignal, ".SREV", kind="omitted")
 
 
-m1 = MyMotor("sky:m1", name="m1", labels=("motor",))
-m2 = MyMotor("sky:m2", name="m2", labels=("motor",))
-m3 = MyMotor("sky:m3", name="m3", labels=("motor",))
-m4 = MyMotor("sky:m4", name="m4", labels=("motor",))
-m5 = MyMotor("sky:m5", name="m5", labels=("motor",))
-m6 = MyMotor("sky:m6", name="m6", labels=("motor",))
-m7 = MyMotor("sky:m7", name="m7", labels=("motor",))
-m8 = MyMotor("sky:m8", name="m8", labels=("motor",))
-# m9-16 are now parts of other devices
+def _motor(name):
+    """lazy MyMotor ``sky:<name>``, built on first use"""
+
+    def factory():
+        return MyMotor(f"sky:{name}", name=name, labels=("motor",))
+
+    def setup(motor):
+        declare_ioc_value(motor.steps_per_rev, 8000)
 
-for m in (m1, m2, m3, m4, m5, m6, m7, m8):
-    m.steps_per_rev.put(8000)
-del m
+    return lazy_device(name, factory, setup, ioc="sky:")
+
+
+m1 = _motor("m1")
+m2 = _motor("m2")
+m3 = _motor("m3")
+m4 = _motor("m4")
+m5 = _motor("m5")
+m6 = _motor("m6")
+m7 = _motor("m7")
+m8 = _motor("m8")
+# m9-16 are now parts of other devices
@@ -9,6 +9,8 @@ from ..session_logs import logger
 logger.info(__file__)
 
 from ophyd import Component, Device, EpicsSignal
+from ..utils.lazy_devices import lazy_component
+from ..utils.lazy_devices import lazy_device
 
 
 class MyRegisters(Device):
@@ -43,12 +45,10 @@ class MyRegisters(Device):
     textwave5 = Component(EpicsSignal, "textwave5", string=True)
 
 
-try:
-    registers = MyRegisters("IOC:", name="registers")
-    det2 = registers.decimal1
-    mover2 = registers.decimal2
-except Exception:
-    print("registers.db IOC is not available")
-    registers = None
-    det2 = None
-    mover2 = None
+# built on first use: raises at once (and is listed in device_report())
+# if the registers.db IOC is not available
+registers = lazy_device(
+    "registers", lambda: MyRegisters("IOC:", name="registers"), ioc="IOC:"
+)
+det2 = lazy_component(registers, "decimal1", "det2")
+mover2 = lazy_component(registers, "decimal2", "mover2")
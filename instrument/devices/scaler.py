@@ -15,30 +15,44 @@ __all__ = [
 
 from ophyd.scaler import ScalerCH
 from ..session_logs import logger
+from ..utils.ioc_state import declare_ioc_value
+from ..utils.ioc_state import reconcile_ioc_state
+from ..utils.lazy_devices import lazy_component
+from ..utils.lazy_devices import lazy_device
 
 logger.info(__file__)
 
 
-scaler = ScalerCH("sky:scaler1", name="scaler", labels=("detectors",))
+def _setup_scaler(scaler):
+    if len(scaler.channels.chan01.chname.get()) == 0:
+        channels = scaler.channels
+        declare_ioc_value(channels.chan01.chname, "clock")
+        declare_ioc_value(channels.chan02.chname, "I0")
+        declare_ioc_value(channels.chan03.chname, "scint")
+        declare_ioc_value(channels.chan05.chname, "diode")
+        declare_ioc_value(channels.chan08.chname, "I0Mon")
+        declare_ioc_value(channels.chan10.chname, "ROI1")
+        declare_ioc_value(channels.chan11.chname, "ROI2")
+        reconcile_ioc_state()  # select_channels() needs the names now
+    scaler.select_channels(None)
 
-if len(scaler.channels.chan01.chname.get()) == 0:
-    scaler.channels.chan01.chname.put("clock")
-    scaler.channels.chan02.chname.put("I0")
-    scaler.channels.chan03.chname.put("scint")
-    scaler.channels.chan05.chname.put("diode")
-    scaler.channels.chan08.chname.put("I0Mon")
-    scaler.channels.chan10.chname.put("ROI1")
-    scaler.channels.chan11.chname.put("ROI2")
-scaler.select_channels(None)
+    for chan in "01 02 03 05 08 10 11".split():
+        obj = getattr(scaler.channels, f"chan{chan}").s
+        obj._ophyd_labels_ = set(list(obj._ophyd_labels_) + ["counter"])
+
+
+scaler = lazy_device(
+    "scaler",
+    lambda: ScalerCH("sky:scaler1", name="scaler", labels=("detectors",)),
+    _setup_scaler,
+    ioc="sky:",
+)
 
 # name some channels for convenience
-clock = scaler.channels.chan01.s
-I0 = scaler.channels.chan02.s
-scint = scaler.channels.chan03.s
-diode = scaler.channels.chan05.s
-I0Mon = scaler.channels.chan08.s
-ROI1 = scaler.channels.chan10.s
-ROI2 = scaler.channels.chan11.s
-
-for obj in (clock, I0, scint, diode, I0Mon, ROI1, ROI2):
-    obj._ophyd_labels_ = set(list(obj._ophyd_labels_) + ["counter"])
+clock = lazy_component(scaler, "channels.chan01.s", "clock")
+I0 = lazy_component(scaler, "channels.chan02.s", "I0")
+scint = lazy_component(scaler, "channels.chan03.s", "scint")
+diode = lazy_component(scaler, "channels.chan05.s", "diode")
+I0Mon = lazy_component(scaler, "channels.chan08.s", "I0Mon")
+ROI1 = lazy_component(scaler, "channels.chan10.s", "ROI1")
+ROI2 = lazy_component(scaler, "channels.chan11.s", "ROI2")
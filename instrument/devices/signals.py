@@ -9,6 +9,7 @@ import numpy
 from ophyd import EpicsSignalRO
 
 from ..session_logs import logger
+from ..utils.lazy_devices import lazy_device
 
 logger.info(__file__)
 
@@ -18,4 +19,10 @@ shutter = apstools.devices.SimulatedApsPssShutterWithStatus(
 shutter.delay_s = 0.05  # shutter needs short recovery time after moving
 
 # demo: use swait records to make "noisy" detector signals
-noisy = EpicsSignalRO("sky:userCalc1", name="noisy", labels=("detectors",))
+noisy = lazy_device(
+    "noisy",
+    lambda: EpicsSignalRO(
+        "sky:userCalc1", name="noisy", labels=("detectors",)
+    ),
+    ioc="sky:",
+)
@@ -9,3 +9,4 @@ from .initialize import *
 from .user_dir import *
 from .metadata import *
 from .callbacks import *
+from .msg_profiler import *
@@ -17,22 +17,28 @@ import apstools.utils
 import datetime
 import os
 
-from .initialize import RE, callback_db
+from ..callbacks.spec_writer import StreamingSpecWriterCallback
+from ..callbacks.timing import run_summary_callback
+from .initialize import RE, TIME_CALLBACKS, callback_db, subscribe_callback
 
-# write scans to SPEC data file
-specwriter = apstools.filewriters.SpecWriterCallback()
+# write scans to SPEC data file, each data row as its event arrives
+specwriter = StreamingSpecWriterCallback(flush="interval", fsync="stop")
 # _path = "/tmp"      # make the SPEC file in /tmp (assumes OS is Linux)
 _path = (
     os.getcwd()
 )  # make the SPEC file in current working directory (assumes is writable)
 specwriter.newfile(os.path.join(_path, specwriter.spec_filename))
-callback_db["specwriter"] = RE.subscribe(specwriter.receiver)
+subscribe_callback("specwriter", specwriter.receiver, policy="never-drop")
 
 logger.info(f"writing to SPEC file: {specwriter.spec_filename}")
 logger.info("   >>>>   Using default SPEC file name   <<<<")
-logger.info("   file will be created when bluesky ends its next scan")
+logger.info("   file will be created with the first data of the next scan")
 logger.info(f"   to change SPEC file, use command:   newSpecFile('title')")
 
+if TIME_CALLBACKS:
+    # subscribed last: sees the other callbacks finish each run
+    callback_db["callback_stats"] = RE.subscribe(run_summary_callback)
+
 
 def spec_comment(comment, doc=None):
     # supply our specwriter to the standard routine
@@ -59,4 +65,4 @@ def newSpecFile(title, scan_id=1):
         handled = "created"
 
     logger.info(f"SPEC file name : {specwriter.spec_filename}")
-    logger.info(f"File will be {handled} at end of next bluesky scan.")
+    logger.info(f"File will be {handled} with the first data of next scan.")
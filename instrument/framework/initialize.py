@@ -11,21 +11,26 @@ __all__ = """
     callback_db
 """.split()
 
+from ..callbacks.batching import BatchedInsert
+from ..callbacks.dispatch import QueuedCallback
+from ..callbacks.journal import DocumentJournal
+from ..callbacks.timing import TimedCallback
+from ..callbacks.timing import callback_stats
+from ..session_logs import environment_flag
+from ..session_logs import HEADLESS
 from ..session_logs import logger
+from .md_store import CoalescingMetadataStore
 
 logger.info(__file__)
 
 from bluesky import RunEngine
 from bluesky import SupplementalData
-from bluesky.callbacks.best_effort import BestEffortCallback
 from bluesky.callbacks.broker import verify_files_saved
-from bluesky.magics import BlueskyMagics
 from bluesky.simulators import summarize_plan
 from bluesky.utils import PersistentDict
 from bluesky.utils import ProgressBarManager
-from bluesky.utils import ts_msg_hook
-from IPython import get_ipython
 from ophyd.signal import EpicsSignalBase
+import atexit
 import databroker
 import ophyd
 import os
@@ -55,28 +60,74 @@ def get_md_path():
     return path
 
 
-# check if we need to transition from SQLite-backed historydict
-old_md = None
+# RE.md is kept in memory and written in the background (md_store.py)
 md_path = get_md_path()
-if not os.path.exists(md_path):
-    logger.info(
-        "New directory to store RE.md between sessions: %s", md_path
-    )
-    os.makedirs(md_path)
-    from bluesky.utils import get_history
-
-    old_md = get_history()
-
-# Set up a RunEngine and use metadata backed PersistentDict
+md_file = md_path + ".msgpack"
+old_md = None
+if not os.path.exists(md_file):
+    logger.info("New file to store RE.md between sessions: %s", md_file)
+    if os.path.exists(md_path):
+        # transition from PersistentDict (one file per key)
+        old_md = dict(PersistentDict(md_path))
+    else:
+        # transition from SQLite-backed historydict
+        from bluesky.utils import get_history
+
+        old_md = get_history()
+
+# Set up a RunEngine and use metadata backed by CoalescingMetadataStore
 RE = RunEngine({})
-RE.md = PersistentDict(md_path)
+RE.md = CoalescingMetadataStore(md_file)
 if old_md is not None:
-    logger.info("migrating RE.md storage to PersistentDict")
+    logger.info("migrating RE.md storage to %s", md_file)
     RE.md.update(old_md)
 
 # keep track of callback subscriptions
 callback_db = {}
 
+# These options are read (when this module is imported) from
+# environment variables, such as INSTRUMENT_QUEUED_CALLBACKS=1
+# (0 for False).
+
+# True: each subscriber handles documents in its own thread (queued),
+# so slow callbacks do not stall the RunEngine
+QUEUED_CALLBACKS = environment_flag("INSTRUMENT_QUEUED_CALLBACKS", False)
+
+# True: write every document to a local journal (.journal directory)
+# first, the database insert runs behind it in its own thread.
+# Use replay_journal() to load documents the database missed.
+JOURNAL_DOCUMENTS = environment_flag("INSTRUMENT_JOURNAL_DOCUMENTS", True)
+
+# longest time (seconds) a stop document waits for the database to
+# store the run (with JOURNAL_DOCUMENTS), then the RunEngine goes on
+# (the documents stay queued, and are in the journal)
+DB_STOP_TIMEOUT = 60
+
+# True: measure the time spent in each callback, see callback_stats()
+TIME_CALLBACKS = environment_flag("INSTRUMENT_TIME_CALLBACKS", True)
+
+
+def subscribe_callback(
+    key, callback, policy="never-drop", queued=None, **kwargs
+):
+    """
+    subscribe ``callback`` to RE, remember it as ``callback_db[key]``
+
+    With ``TIME_CALLBACKS``, the callback is timed (as ``key``).
+    With ``QUEUED_CALLBACKS`` (or ``queued=True``), the callback runs
+    in its own thread with the queue ``policy`` and ``kwargs``
+    (see :class:`~instrument.callbacks.QueuedCallback`).
+
+    Returns the subscribed callable.
+    """
+    if TIME_CALLBACKS:
+        callback = TimedCallback(callback, key)
+    if QUEUED_CALLBACKS if queued is None else queued:
+        callback = QueuedCallback(callback, key, policy=policy, **kwargs)
+    callback_db[key] = RE.subscribe(callback)
+    return callback
+
+
 # # Set up a Broker.
 # db = databroker.Broker.named("mongodb_config")
 # Connect with our mongodb database
@@ -85,7 +136,21 @@ db = databroker.catalog["quokka_intake"].v1
 
 # Subscribe metadatastore to documents.
 # If this is removed, data is not saved to metadatastore.
-callback_db["db"] = RE.subscribe(db.insert)
+# events & datums are inserted in pages (fewer database round trips)
+if JOURNAL_DOCUMENTS:
+    journal = DocumentJournal()
+    atexit.register(journal.close)
+    subscribe_callback("journal", journal, queued=False)
+    _db_queue = subscribe_callback(
+        "db",
+        BatchedInsert(db.insert),
+        policy="never-drop",
+        queued=True,
+        stop_timeout=DB_STOP_TIMEOUT,
+    )
+    atexit.register(_db_queue.flush, 10)  # give the database a chance
+else:
+    subscribe_callback("db", BatchedInsert(db.insert), policy="never-drop")
 
 # Set up SupplementalData.
 sd = SupplementalData()
@@ -95,14 +160,37 @@ RE.preprocessors.append(sd)
 pbar_manager = ProgressBarManager()
 RE.waiting_hook = pbar_manager
 
-# Register bluesky IPython magics.
-get_ipython().register_magics(BlueskyMagics)
+if not HEADLESS:
+    from bluesky.magics import BlueskyMagics
+    from IPython import get_ipython
 
-# Set up the BestEffortCallback.
-bec = BestEffortCallback()
-callback_db["bec"] = RE.subscribe(bec)
-peaks = bec.peaks  # just as alias for less typing
-bec.disable_baseline()
+    # Register bluesky IPython magics.
+    get_ipython().register_magics(BlueskyMagics)
+
+    def _callback_stats_magic(line):
+        """%callback_stats: table of the time spent in each RE callback"""
+        callback_stats()
+
+    get_ipython().register_magic_function(
+        _callback_stats_magic, "line", "callback_stats"
+    )
+
+# Set up the BestEffortCallback (not headless: it imports pyplot).
+# live plots: redrawn at most 5 times per second (all together),
+# at most 2000 points per line until each run stops,
+# at most 5 curves per plot (the oldest are removed)
+if HEADLESS:
+    bec = peaks = None
+else:
+    from ..callbacks.live_plots import ThrottledBestEffortCallback
+
+    bec = ThrottledBestEffortCallback(
+        max_refresh_rate=5, max_points=2000, max_curves=5
+    )
+    # always in the RunEngine thread: matplotlib draws in the main thread
+    subscribe_callback("bec", bec, queued=False)
+    peaks = bec.peaks  # just as alias for less typing
+    bec.disable_baseline()
 
 # set default timeout for all EpicsSignalBase connections & communications
 try:
@@ -130,5 +218,6 @@ except Exception as exc:
 # verbose messages for debugging.
 # ophyd.logger.setLevel(logging.DEBUG)
 
-# diagnostics
-# RE.msg_hook = ts_msg_hook
+# diagnostics: where does the time of each run go?
+# see msg_profiler.py (INSTRUMENT_PROFILE_MESSAGES=1, or
+# msg_profiler.install(RE))
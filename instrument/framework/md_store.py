@@ -0,0 +1,169 @@
+"""
+RE.md storage: in memory, written to disk in the background
+
+``PersistentDict`` writes (and syncs) a file each time a key changes,
+in the RunEngine thread (such as the ``scan_id`` of every run).
+:class:`CoalescingMetadataStore` keeps the metadata in memory and
+writes all of it, at most every ``flush_interval`` seconds, from a
+background thread, and at exit.
+
+The metadata is one msgpack file (numpy arrays by msgpack_numpy),
+written to a temporary file and renamed over the old one, so a crash
+leaves either the old or the new metadata, never a partial file.  One
+file loads fast, even when ``RE.md`` has many keys.  If a write fails
+(such as a full disk), it is logged once and tried again, waiting twice
+as long after each failure (up to ``MAX_RETRY_INTERVAL`` seconds).
+
+EXAMPLE::
+
+    RE.md = CoalescingMetadataStore("~/.config/RE_md.msgpack")
+"""
+
+__all__ = [
+    "CoalescingMetadataStore",
+]
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+import atexit
+import collections.abc
+import os
+import threading
+import time
+
+import msgpack
+import msgpack_numpy
+
+MAX_RETRY_INTERVAL = 60  # seconds, longest wait to retry a failed write
+
+
+class CoalescingMetadataStore(collections.abc.MutableMapping):
+    """
+    dictionary for ``RE.md``, saved to ``filename`` in the background
+
+    PARAMETERS
+
+    filename : str
+        msgpack file with the metadata (created if it does not exist)
+    flush_interval : float
+        longest time (seconds) a change waits to be written
+    """
+
+    def __init__(self, filename, flush_interval=0.5):
+        self.filename = os.path.abspath(os.path.expanduser(filename))
+        self.flush_interval = flush_interval
+        self._data = self._load()
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._writer = threading.Thread(
+            target=self._run, name="RE.md writer", daemon=True
+        )
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _load(self):
+        if not os.path.exists(self.filename):
+            return {}
+        with open(self.filename, "rb") as f:
+            return msgpack.unpackb(
+                f.read(), object_hook=msgpack_numpy.decode, raw=False
+            )
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._changed()
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
+            self._changed()
+
+    def __iter__(self):
+        return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return repr(self._data)
+
+    def _changed(self):
+        if not self._dirty:
+            self._dirty = True
+            self._wake.set()
+
+    def _run(self):
+        delay = self.flush_interval
+        failures = 0
+        while not self._closed:
+            self._wake.wait()
+            self._wake.clear()
+            # let more changes arrive, then write them all at once
+            time.sleep(delay)
+            try:
+                self.flush()
+            except Exception:
+                failures += 1
+                if failures == 1:
+                    logger.exception(
+                        "cannot write RE.md to %s, will keep trying",
+                        self.filename,
+                    )
+                # back off: do not retry (and fail) every flush_interval
+                delay = max(
+                    min(2 * delay, MAX_RETRY_INTERVAL), self.flush_interval
+                )
+            else:
+                if failures > 0:
+                    logger.info(
+                        "wrote RE.md to %s after %d failed attempts",
+                        self.filename,
+                        failures,
+                    )
+                failures = 0
+                delay = self.flush_interval
+
+    def flush(self):
+        """write the metadata now (if it changed)"""
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                payload = msgpack.packb(
+                    self._data,
+                    default=msgpack_numpy.encode,
+                    use_bin_type=True,
+                )
+                self._dirty = False
+            try:
+                self._write(payload)
+            except Exception:
+                with self._lock:
+                    self._dirty = True
+                    self._wake.set()  # try again later
+                raise
+
+    def _write(self, payload):
+        """replace the file with ``payload`` (atomic rename)"""
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        temporary = f"{self.filename}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.filename)
+
+    def close(self):
+        """write any changes, stop the background writer"""
+        self._closed = True
+        self._wake.set()
+        self.flush()
@@ -1,4 +1,5 @@
 """
+default metadata (and software versions) for RE.md
 """
 
 __all__ = []
@@ -7,26 +8,20 @@ from ..session_logs import logger
 
 logger.info(__file__)
 
-import gi
-
-gi.require_version("Hkl", "5.0")
-
-import apstools
-import bluesky
-import databroker
-from datetime import datetime
-import epics
-import event_model
+from bluesky import preprocessors as bpp
 import getpass
-import h5py
-import hkl
-import matplotlib
-import numpy
-import ophyd
+import hashlib
+import importlib
+import json
 import os
-import pyRestTable
+import site
 import socket
-import spec2nexus
+import sys
+
+try:
+    from importlib import metadata as importlib_metadata
+except ImportError:  # Python < 3.8
+    import importlib_metadata
 
 from .initialize import RE
 
@@ -41,17 +36,96 @@ USERNAME = getpass.getuser() or "APS poof user"
 RE.md["login_id"] = USERNAME + "@" + HOSTNAME
 
 # useful diagnostic to record with all data
-RE.md["versions"] = dict(
-    apstools=apstools.__version__,
-    bluesky=bluesky.__version__,
-    databroker=databroker.__version__,
-    epics=epics.__version__,
-    event_model=event_model.__version__,
-    h5py=h5py.__version__,
-    hkl=hkl.__version__,
-    matplotlib=matplotlib.__version__,
-    numpy=numpy.__version__,
-    ophyd=ophyd.__version__,
-    pyRestTable=pyRestTable.__version__,
-    spec2nexus=spec2nexus.__version__,
+# key: module name, value: name of its installed distribution
+VERSIONED_PACKAGES = dict(
+    apstools="apstools",
+    bluesky="bluesky",
+    databroker="databroker",
+    epics="pyepics",
+    event_model="event-model",
+    h5py="h5py",
+    hkl="hklpy",
+    matplotlib="matplotlib",
+    numpy="numpy",
+    ophyd="ophyd",
+    pyRestTable="pyRestTable",
+    spec2nexus="spec2nexus",
 )
+VERSIONS_CACHE_FILE = os.path.join(
+    os.path.expanduser("~"), ".cache", "instrument", "versions.json"
+)
+
+
+def _site_packages_key():
+    """identify the state of the installed packages (changes on install)"""
+    paths = list(site.getsitepackages())
+    if site.ENABLE_USER_SITE:
+        paths.append(site.getusersitepackages())
+    state = [sys.prefix, sys.version, VERSIONED_PACKAGES]
+    for path in paths:
+        if os.path.isdir(path):
+            state.append((path, os.stat(path).st_mtime_ns))
+    text = json.dumps(state, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _package_version(module_name, dist_name):
+    """version from package metadata, import only if no metadata"""
+    try:
+        return importlib_metadata.version(dist_name)
+    except importlib_metadata.PackageNotFoundError:
+        logger.debug("no metadata for %s, importing it", dist_name)
+        try:
+            module = importlib.import_module(module_name)
+            return getattr(module, "__version__", None)
+        except ImportError as exc:
+            logger.warning("cannot get version of %s: %s", module_name, exc)
+
+
+def get_versions():
+    """
+    versions of the VERSIONED_PACKAGES, without importing them
+
+    Cached on disk, the cache is valid until site-packages changes.
+    """
+    key = _site_packages_key()
+    try:
+        with open(VERSIONS_CACHE_FILE) as f:
+            cache = json.load(f)
+        if cache.get("key") == key:
+            return cache["versions"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    versions = {
+        module_name: _package_version(module_name, dist_name)
+        for module_name, dist_name in VERSIONED_PACKAGES.items()
+    }
+    try:
+        os.makedirs(os.path.dirname(VERSIONS_CACHE_FILE), exist_ok=True)
+        with open(VERSIONS_CACHE_FILE, "w") as f:
+            json.dump(dict(key=key, versions=versions), f, indent=2)
+    except OSError as exc:
+        logger.warning("cannot write %s: %s", VERSIONS_CACHE_FILE, exc)
+    return versions
+
+
+_versions_recorded = False
+
+
+def record_versions(plan):
+    """
+    preprocessor: set RE.md["versions"] at the first open_run of the session
+    """
+
+    def _fill(msg):
+        global _versions_recorded
+        if msg.command == "open_run" and not _versions_recorded:
+            RE.md["versions"] = get_versions()
+            _versions_recorded = True
+        return msg
+
+    return (yield from bpp.msg_mutator(plan, _fill))
+
+
+RE.preprocessors.append(record_versions)
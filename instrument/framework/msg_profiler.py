@@ -0,0 +1,243 @@
+"""
+RunEngine message profiler: where does the time of each run go?
+
+Installed as ``RE.msg_hook`` (replaces ``ts_msg_hook``), the profiler
+records each ``Msg`` with its start and end times (the end is the start
+of the next message, so it includes the plan's own overhead), command,
+object, and the plan stack (names of the nested plans that yielded it).
+
+Time is grouped by category:
+
+``set/wait``
+    ``set`` and the ``wait`` for a group of ``set`` (motion)
+``trigger``
+    ``trigger`` and the ``wait`` for a group of only ``trigger``
+    (such as scaler counting)
+``read``, ``sleep``
+    these commands
+``callbacks``
+    ``open_run``, ``create``, ``save``, ``close_run``: the documents
+    are emitted to the callbacks during these
+``other``
+    everything else
+
+EXAMPLE::
+
+    msg_profiler.install(RE)
+    RE(tune_Gslits())
+    msg_profiler.report()           # the last run
+    msg_profiler.report(run=None)   # all runs (and between runs)
+    msg_profiler.export_folded("tune.folded")   # for flamegraph.pl
+"""
+
+__all__ = """
+    MsgProfiler
+    msg_profiler
+""".split()
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+import collections
+import os
+import time
+
+import pyRestTable
+
+from ..session_logs import environment_flag
+from .initialize import RE
+
+# True: profile all plans, from the start of the session
+# (environment variable INSTRUMENT_PROFILE_MESSAGES=1)
+PROFILE_MESSAGES = environment_flag("INSTRUMENT_PROFILE_MESSAGES", False)
+
+CATEGORIES = dict(
+    set="set/wait",
+    wait="set/wait",
+    trigger="trigger",
+    read="read",
+    sleep="sleep",
+    open_run="callbacks",
+    create="callbacks",
+    save="callbacks",
+    close_run="callbacks",
+)
+# plan stack frames from these files are wrappers, not shown
+HIDDEN_FILES = (
+    "bluesky/preprocessors.py",
+    "bluesky/utils.py",
+    __file__.replace(os.sep, "/"),
+)
+MAX_RECORDS = 1_000_000
+
+Record = collections.namedtuple(
+    "Record", "start end command obj category stack run"
+)
+
+
+class MsgProfiler:
+    """
+    record every RunEngine message: times, command, object, plan stack
+
+    PARAMETERS
+
+    max_records : int
+        keep this many of the most recent messages
+    """
+
+    def __init__(self, max_records=MAX_RECORDS):
+        self.records = collections.deque(maxlen=max_records)
+        self.runs = []  # (run number, plan name, start time)
+        self._RE = None
+        self._chained_hook = None
+        self._pending = None  # message in progress: [start, ...]
+        self._run = None  # index in self.runs, when in a run
+        self._groups = {}  # group: {commands}
+        self._stacks = {}  # interned plan stacks
+
+    def install(self, RE):
+        """start profiling ``RE`` (keep any msg_hook already installed)"""
+        if self._RE is not None:
+            self.uninstall()
+        self._RE = RE
+        self._chained_hook = RE.msg_hook
+        RE.msg_hook = self._hook
+        RE.preprocessors.append(self._wrap_plan)
+        logger.info("RunEngine message profiler installed")
+
+    def uninstall(self):
+        """stop profiling, restore the previous msg_hook"""
+        RE = self._RE
+        if RE is None:
+            return
+        RE.msg_hook = self._chained_hook
+        if self._wrap_plan in RE.preprocessors:
+            RE.preprocessors.remove(self._wrap_plan)
+        self._RE = self._chained_hook = None
+
+    def clear(self):
+        """forget all records"""
+        self.records.clear()
+        self.runs = []
+        self._run = None
+
+    def _wrap_plan(self, plan):
+        """preprocessor: end the last message when the plan ends"""
+        try:
+            return (yield from plan)
+        finally:
+            self._finish(time.perf_counter())
+
+    def _plan_stack(self):
+        names = []
+        for gen in list(getattr(self._RE, "_plan_stack", ())):
+            while gen is not None and hasattr(gen, "gi_code"):
+                code = gen.gi_code
+                filename = code.co_filename.replace(os.sep, "/")
+                if not filename.endswith(HIDDEN_FILES):
+                    names.append(code.co_name)
+                gen = gen.gi_yieldfrom
+        stack = tuple(names)
+        return self._stacks.setdefault(stack, stack)
+
+    def _finish(self, now):
+        """the message in progress ends ``now``"""
+        if self._pending is not None:
+            start, *details = self._pending
+            self.records.append(Record(start, now, *details))
+            self._pending = None
+
+    def _hook(self, msg):
+        now = time.perf_counter()
+        self._finish(now)
+
+        command = msg.command
+        group = msg.kwargs.get("group")
+        if command == "wait":
+            commands = self._groups.pop(group, ())
+            category = "trigger" if commands == {"trigger"} else "set/wait"
+        else:
+            if command in ("set", "trigger") and group is not None:
+                self._groups.setdefault(group, set()).add(command)
+            category = CATEGORIES.get(command, "other")
+
+        stack = self._plan_stack()
+        if command == "open_run":
+            self.runs.append((len(self.runs) + 1, (stack or ("",))[0], now))
+            self._run = len(self.runs) - 1
+        obj = getattr(msg.obj, "name", None)
+        self._pending = [now, command, obj, category, stack, self._run]
+        if command == "close_run":
+            self._run = None
+
+        if self._chained_hook is not None:
+            self._chained_hook(msg)
+
+    def _select(self, run):
+        if run is None:
+            return list(self.records)
+        if len(self.runs) == 0:
+            return []
+        run = range(len(self.runs))[run]  # allow negative index
+        return [r for r in self.records if r.run == run]
+
+    def summary(self, run=-1):
+        """
+        ``{category: [seconds, messages]}`` for one run
+
+        PARAMETERS
+
+        run : int
+            index of the run (default: the last), None for all records
+        """
+        result = {}
+        for r in self._select(run):
+            totals = result.setdefault(r.category, [0.0, 0])
+            totals[0] += r.end - r.start
+            totals[1] += 1
+        return result
+
+    def report(self, run=-1, show=True):
+        """table of the time per category, for one run (or all: None)"""
+        summary = self.summary(run)
+        total = sum(t for t, n in summary.values()) or 1
+        table = pyRestTable.Table()
+        table.labels = "category time_s percent messages".split()
+        for category, (t, n) in sorted(
+            summary.items(), key=lambda kv: -kv[1][0]
+        ):
+            table.addRow((category, f"{t:.3f}", f"{100 * t / total:.1f}", n))
+        if show:
+            if run is not None and len(self.runs) > 0:
+                number, plan_name, _t = self.runs[run]
+                print(f"run {number} ({plan_name})")
+            print(table)
+        return table
+
+    def folded_stacks(self, run=None):
+        """
+        ``{folded stack: microseconds}``, in the flame graph format
+
+        Each stack is ``plan;plan;...;category;command:obj``.
+        """
+        result = collections.defaultdict(int)
+        for r in self._select(run):
+            leaf = r.command if r.obj is None else f"{r.command}:{r.obj}"
+            key = ";".join(r.stack + (r.category, leaf))
+            result[key] += int(1e6 * (r.end - r.start))
+        return dict(result)
+
+    def export_folded(self, filename, run=None):
+        """
+        write the folded stacks, for ``flamegraph.pl`` or speedscope
+        """
+        with open(filename, "w") as f:
+            for key, us in sorted(self.folded_stacks(run).items()):
+                f.write(f"{key.replace(' ', '_')} {us}\n")
+        logger.info("message profile written: %s", filename)
+
+
+msg_profiler = MsgProfiler()
+if PROFILE_MESSAGES:
+    msg_profiler.install(RE)
@@ -0,0 +1,29 @@
+"""
+configure for data collection in a headless worker process
+
+Same RE, db, devices, and plans as ``instrument.collection`` but no
+IPython magics, no console input logging, and no plots (``bec`` and
+``peaks`` are None, this package does not import pyplot).  If a
+dependency imports pyplot (apstools 1.5 does, through bluesky's
+BestEffortCallback), it has the Agg backend and that is logged.
+For automated work (such as ``tune_Gslits``) in plain Python processes::
+
+    from instrument.headless import *
+
+Must be imported before any other ``instrument`` module.
+"""
+
+import os
+import sys
+
+os.environ["INSTRUMENT_HEADLESS"] = "1"
+
+from .collection import *
+from .session_logs import logger
+
+if "matplotlib.pyplot" in sys.modules:
+    logger.warning(
+        "headless session: a dependency imported matplotlib.pyplot"
+        " (backend: %s)",
+        sys.modules["matplotlib"].get_backend(),
+    )
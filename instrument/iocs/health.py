@@ -0,0 +1,188 @@
+"""
+health of the EPICS IOCs: probe all at once, start the missing ones
+
+Each IOC is known by its PV prefix and has a *heartbeat* PV.  All heartbeats
+are read concurrently (one timeout for all) and the result is cached for
+a short time, so device modules can ask :func:`ioc_is_up` cheaply and skip
+an IOC that is down instead of each waiting on its own connection timeout.
+"""
+
+__all__ = """
+    IOCS
+    ioc_boot_times
+    ioc_is_up
+    ioc_status
+    start_missing_iocs
+""".split()
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+import epics
+import os
+import subprocess
+import time
+
+_bin = os.path.join(os.path.expanduser("~"), "bin")
+
+# key: IOC prefix
+#   heartbeat: PV (one the devices read) that answers when the IOC runs
+#   start: command to start the IOC (None: not started from here)
+#   boot_time: (optional) iocStats PV with the time the IOC was started
+IOCS = {
+    "sky:": dict(
+        heartbeat="sky:UPTIME",
+        start=[os.path.join(_bin, "start_iocs.sh")],
+        boot_time="sky:STARTTOD",  # same as iocsky.start_time
+    ),
+    "adsky:": dict(heartbeat="adsky:cam1:Acquire", start=None),
+    "IOC:": dict(heartbeat="IOC:float1", start=None),
+    "lax:": dict(heartbeat="lax:m1.RBV", start=None),  # guard_slit.x
+}
+PROBE_TIMEOUT = 1  # seconds, for all heartbeats together
+STATUS_TTL = 10  # seconds, how long a probe result is trusted
+
+_status = {}  # prefix: (time of probe, is up?)
+
+
+def _caget_many(pvs, timeout, as_string=False):
+    """
+    values of ``pvs`` (None: no answer), all read within ``timeout`` seconds
+
+    All channels are created first, then their connections and reads are
+    awaited against one deadline: the IOCs that are down cost ``timeout``
+    once, not a connection timeout each.  Safe from any thread.
+    """
+    epics.ca.use_initial_context()
+    deadline = time.time() + timeout
+    chids = [
+        epics.ca.create_channel(pv, connect=False, auto_cb=False)
+        for pv in pvs
+    ]
+
+    def connected(chid):
+        return epics.ca.state(chid) == epics.dbr.CS_CONN
+
+    # read each channel as soon as it connects
+    requested = [False] * len(chids)
+    while True:
+        for i, chid in enumerate(chids):
+            if not requested[i] and connected(chid):
+                epics.ca.get(chid, as_string=as_string, wait=False)
+                requested[i] = True
+        if all(requested) or time.time() >= deadline:
+            break
+        epics.ca.poll()
+    return [
+        epics.ca.get_complete(
+            chid,
+            as_string=as_string,
+            timeout=max(deadline - time.time(), 0.001),
+        )
+        if ok
+        else None
+        for chid, ok in zip(chids, requested)
+    ]
+
+
+def ioc_status(prefixes=None, timeout=PROBE_TIMEOUT, ttl=STATUS_TTL):
+    """
+    dict of IOC prefix: True if the IOC is running
+
+    Probes (concurrently) only the IOCs with no result newer than ``ttl``.
+    """
+    prefixes = list(IOCS if prefixes is None else prefixes)
+    now = time.time()
+    stale = [
+        prefix
+        for prefix in prefixes
+        if prefix in IOCS and now - _status.get(prefix, (0, None))[0] > ttl
+    ]
+    if len(stale) > 0:
+        pvs = [IOCS[prefix]["heartbeat"] for prefix in stale]
+        values = _caget_many(pvs, timeout)
+        now = time.time()
+        for prefix, value in zip(stale, values):
+            _status[prefix] = (now, value is not None)
+            logger.debug(
+                "IOC %s is %s", prefix, "up" if value is not None else "down"
+            )
+    return {
+        prefix: _status[prefix][1] if prefix in _status else True
+        for prefix in prefixes
+    }
+
+
+def ioc_is_up(prefix, ttl=STATUS_TTL):
+    """
+    fast check: is the IOC that serves ``prefix`` running?
+
+    ``prefix`` may be any PV name, its IOC is found from the known prefixes.
+    Unknown IOCs are assumed to be running.
+    """
+    for known in IOCS:
+        if prefix.startswith(known):
+            return ioc_status([known], ttl=ttl)[known]
+    return True
+
+
+def ioc_boot_times(prefixes=None, timeout=PROBE_TIMEOUT):
+    """
+    dict of IOC prefix: time (text) the IOC was started, read concurrently
+
+    None if the IOC has no ``boot_time`` PV or it did not answer.
+    """
+    prefixes = [
+        prefix
+        for prefix in (IOCS if prefixes is None else prefixes)
+        if prefix in IOCS
+    ]
+    boot_times = {prefix: None for prefix in prefixes}
+    known = [p for p in prefixes if IOCS[p].get("boot_time") is not None]
+    if len(known) > 0:
+        pvs = [IOCS[prefix]["boot_time"] for prefix in known]
+        values = _caget_many(pvs, timeout, as_string=True)
+        boot_times.update(dict(zip(known, values)))
+    return boot_times
+
+
+def start_missing_iocs(prefixes=None, timeout=60, poll=0.5):
+    """
+    start only the IOCs that are not running, wait until they are ready
+
+    Returns the dict of IOC prefix: True if the IOC is running.
+    """
+    status = ioc_status(prefixes, ttl=0)
+    missing = [prefix for prefix, up in status.items() if not up]
+    if len(missing) == 0:
+        logger.info("EPICS IOCs ready...")
+        return status
+
+    commands = []  # some IOCs share a start command, run it once
+    for prefix in missing:
+        command = IOCS[prefix]["start"]
+        if command is None:
+            logger.warning("IOC %s is not running, cannot start it", prefix)
+        elif command not in commands:
+            commands.append(command)
+    for command in commands:
+        logger.info("Starting EPICS IOC(s): %s", " ".join(command))
+        try:
+            subprocess.run(command, check=True)
+        except (OSError, subprocess.CalledProcessError) as exc:
+            logger.error("could not start IOC(s): %s", exc)
+
+    startable = [p for p in missing if IOCS[p]["start"] is not None]
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status.update(ioc_status(startable, ttl=0))
+        if all(status[prefix] for prefix in startable):
+            break
+        time.sleep(poll)
+    for prefix in startable:
+        if status[prefix]:
+            logger.debug("IOC %s started", prefix)
+        else:
+            logger.warning("IOC %s not ready after %s s", prefix, timeout)
+    return status
@@ -1,8 +1,12 @@
 """
 configure matplotlib for console or notebook session
 MUST be run BEFORE other initializations
+
+(nothing to configure in a headless session)
 """
 
+from ..session_logs import HEADLESS
+
 
 def isnotebook():
     """
@@ -20,7 +24,9 @@ def isnotebook():
         return False  # Probably standard Python interpreter
 
 
-if isnotebook():
+if HEADLESS:
+    pass
+elif isnotebook():
     from .notebook import *
 else:
     from .console import *
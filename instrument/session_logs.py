@@ -6,31 +6,166 @@ __all__ = [
     "logger",
 ]
 
+import atexit
+import glob
+import gzip
 import logging
+import logging.handlers
 import os
+import queue
+import shutil
 import stdlogpj
 
+
+def environment_flag(name, default):
+    """
+    True or False from environment variable ``name``, else ``default``
+
+    Unset: ``default``.  False: ``""``, ``0``, ``false``, ``no``, or
+    ``off``, True: any other value.
+    """
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("", "0", "false", "no", "off")
+
+
 _log_path = os.path.join(os.getcwd(), ".logs")
 if not os.path.exists(_log_path):
     os.mkdir(_log_path)
 CONSOLE_IO_FILE = os.path.join(_log_path, "ipython_console.log")
 
-# start logging console to file
-# https://ipython.org/ipython-doc/3/interactive/magics.html#magic-logstart
-from IPython import get_ipython
+# headless: no IPython (magics, console log) and no plots (pyplot)
+# set by instrument.headless, or when not running in IPython
+HEADLESS = environment_flag("INSTRUMENT_HEADLESS", False)
+if not HEADLESS:
+    from IPython import get_ipython
 
-_ipython = get_ipython()
-# %logstart -o -t .ipython_console.log "rotate"
-_ipython.magic(f"logstart -o -t {CONSOLE_IO_FILE} rotate")
+    _ipython = get_ipython()
+    HEADLESS = _ipython is None
+if HEADLESS:
+    # pyplot, if a dependency imports it: no windows, no GUI toolkit
+    os.environ.setdefault("MPLBACKEND", "Agg")
+
+if not HEADLESS:
+    # start logging console to file
+    # https://ipython.org/ipython-doc/3/interactive/magics.html#magic-logstart
+    # %logstart -o -t .ipython_console.log "rotate"
+    _ipython.magic(f"logstart -o -t {CONSOLE_IO_FILE} rotate")
 
 BYTE = 1
 kB = 1024 * BYTE
 MB = 1024 * kB
+LOG_FILE_BYTES = 1 * MB  # rotate the log file at this size
+LOG_TOTAL_BYTES = 10 * MB  # most disk space for the log file & rotations
+# gzip the rotated log files (INSTRUMENT_COMPRESS_LOGS=0: do not)
+COMPRESS_LOGS = environment_flag("INSTRUMENT_COMPRESS_LOGS", True)
+# True: log calls only queue the record, a background thread
+# formats and writes it (and rotates the files)
+QUEUED_LOGGING = environment_flag("INSTRUMENT_QUEUED_LOGGING", True)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    queue the record as it is: formatted by the listener's handlers
+
+    (The arguments of a log call are formatted later, in the listener's
+    thread.  Do not log an object that is changed right after.)
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def stop(self):
+        """write all queued records, stop the thread (once)"""
+        if self._thread is not None:
+            super().stop()
+
+
+def _rotate_with_gzip(source, dest):
+    """rotate the log file to ``dest``, compressed"""
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def _limit_total_size(log_file, total_bytes):
+    """remove the oldest rotated files until all fit in ``total_bytes``"""
+
+    def rotation_number(name):
+        try:
+            return int(name[len(log_file) + 1 :].split(".")[0])
+        except ValueError:
+            return 0
+
+    rotated = sorted(glob.glob(log_file + ".*"), key=rotation_number)
+    files = [log_file] + rotated
+    sizes = {f: os.path.getsize(f) for f in files if os.path.exists(f)}
+    total = sum(sizes.values())
+    while total > total_bytes and len(rotated) > 0:
+        oldest = rotated.pop()
+        total -= sizes.get(oldest, 0)
+        os.remove(oldest)
+
+
+def compress_rotated_logs(handler, total_bytes=LOG_TOTAL_BYTES):
+    """
+    gzip the files rotated by ``handler`` (a RotatingFileHandler)
+
+    Keep as many rotated files as fit in ``total_bytes`` (with the
+    current log file).
+    """
+
+    def rotator(source, dest):
+        _rotate_with_gzip(source, dest)
+        # leave room for the new log file to grow to maxBytes
+        _limit_total_size(source, total_bytes - handler.maxBytes)
+
+    handler.namer = lambda name: name + ".gz"
+    handler.rotator = rotator
+    # enough rotations: the total size is the limit
+    handler.backupCount = max(
+        handler.backupCount, 10 * total_bytes // max(handler.maxBytes, 1)
+    )
+
+
+def queue_handlers(logger):
+    """
+    move the handlers of ``logger`` to a background thread
+
+    ``logger`` then only queues each record.  Returns the
+    ``QueueListener`` (already started, stopped at exit).
+    """
+    handlers = list(logger.handlers)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(_DeferredQueueHandler(log_queue))
+    listener = _QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)  # write all queued records at exit
+    return listener
+
+
 logger = stdlogpj.standard_logging_setup(
-    "bluesky-session", "ipython_logger", maxBytes=1 * MB, backupCount=9
+    "bluesky-session",
+    "ipython_logger",
+    maxBytes=LOG_FILE_BYTES,
+    backupCount=max(LOG_TOTAL_BYTES // LOG_FILE_BYTES - 1, 1),
 )
 logger.setLevel(logging.DEBUG)
+if COMPRESS_LOGS:
+    for _handler in logger.handlers:
+        if isinstance(_handler, logging.handlers.RotatingFileHandler):
+            compress_rotated_logs(_handler, LOG_TOTAL_BYTES)
+log_listener = queue_handlers(logger) if QUEUED_LOGGING else None
 
 logger.info("#" * 60 + " startup")
 logger.info("logging started")
 logger.info(f"logging level = {logger.level}")
+if HEADLESS:
+    logger.info("headless session: no IPython magics, no plots")
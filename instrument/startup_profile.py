@@ -0,0 +1,253 @@
+"""
+measure the startup cost of each module imported by ``instrument.collection``
+
+For each ``instrument.*`` module, record the wall time, the number of
+EPICS channel access calls (connections, gets, puts), and the change in
+memory (RSS) while it was imported.  Cost of third-party packages is
+charged to the instrument module that imported them first.
+
+The report is saved (JSON) in the ``.logs`` directory, next to the previous
+report, and printed as a table (sorted by time) with the change from the
+previous startup.
+
+Imported first thing by ``instrument.collection``.  Does not import
+``session_logs`` (or anything else in this package) until :meth:`finish`
+so that those modules are measured, too.
+"""
+
+__all__ = [
+    "startup_profiler",
+]
+
+import datetime
+import importlib.abc
+import json
+import os
+import resource
+import sys
+import time
+
+CA_FUNCTIONS = """
+    create_channel get get_with_metadata get_ctrlvars get_timevars put
+""".split()
+REPORT_FILE = os.path.join(os.getcwd(), ".logs", "startup_profile.json")
+
+
+def _rss():
+    """resident memory of this process (bytes)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        # peak, not current, but still shows growth
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _ProfilingLoader:
+    """wrap a module loader, time its ``exec_module()``"""
+
+    def __init__(self, loader, profiler, fullname):
+        self._loader = loader
+        self._profiler = profiler
+        self._fullname = fullname
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        if self._fullname == "epics.ca":
+            self._loader.exec_module(module)
+            self._profiler._count_ca_calls(module)
+            return
+        self._profiler._enter(self._fullname)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(self._fullname)
+
+
+class _ProfilingFinder(importlib.abc.MetaPathFinder):
+    """find the modules to be profiled, give them a profiling loader"""
+
+    def __init__(self, profiler, package):
+        self._profiler = profiler
+        self._package = package
+
+    def find_spec(self, fullname, path, target=None):
+        if not (
+            fullname.startswith(self._package + ".")
+            or fullname == "epics.ca"
+        ):
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _ProfilingLoader(
+                spec.loader, self._profiler, fullname
+            )
+        return spec
+
+
+class StartupProfiler:
+    """
+    record the cost of each module while ``instrument.collection`` loads
+    """
+
+    def __init__(self, package="instrument"):
+        self.package = package
+        self.ca_calls = 0
+        self.records = {}
+        self._finder = None
+        self._stack = []
+        self._t0 = None
+
+    def start(self):
+        """start recording (installs an import hook)"""
+        if self._finder is not None:
+            return
+        self._finder = _ProfilingFinder(self, self.package)
+        sys.meta_path.insert(0, self._finder)
+        self._t0 = time.time()
+        if "epics.ca" in sys.modules:
+            self._count_ca_calls(sys.modules["epics.ca"])
+
+    def stop(self):
+        """stop recording (removes the import hook)"""
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+        self._finder = None
+
+    def _count_ca_calls(self, ca):
+        """wrap the channel access functions to count the calls"""
+
+        def counted(func):
+            def wrapper(*args, **kwargs):
+                self.ca_calls += 1
+                return func(*args, **kwargs)
+
+            wrapper.__wrapped__ = func
+            wrapper.__doc__ = func.__doc__
+            return wrapper
+
+        for name in CA_FUNCTIONS:
+            func = getattr(ca, name, None)
+            if func is not None and not hasattr(func, "__wrapped__"):
+                setattr(ca, name, counted(func))
+
+    def _enter(self, name):
+        self._stack.append(
+            dict(
+                name=name,
+                t0=time.time(),
+                ca0=self.ca_calls,
+                mem0=_rss(),
+                child_time=0,
+                child_ca=0,
+                child_mem=0,
+            )
+        )
+
+    def _exit(self, name):
+        frame = self._stack.pop()
+        total_time = time.time() - frame["t0"]
+        total_ca = self.ca_calls - frame["ca0"]
+        total_mem = _rss() - frame["mem0"]
+        self.records[name] = dict(
+            time=total_time - frame["child_time"],
+            total_time=total_time,
+            ca_calls=total_ca - frame["child_ca"],
+            memory=total_mem - frame["child_mem"],
+        )
+        if len(self._stack) > 0:
+            parent = self._stack[-1]
+            parent["child_time"] += total_time
+            parent["child_ca"] += total_ca
+            parent["child_mem"] += total_mem
+
+    def report(self):
+        """dictionary of the measurements"""
+        return dict(
+            date=datetime.datetime.now().isoformat(sep=" "),
+            python=sys.version.split()[0],
+            total_time=time.time() - (self._t0 or time.time()),
+            ca_calls=self.ca_calls,
+            modules=self.records,
+        )
+
+    def table(self, report=None, previous=None):
+        """table of modules, most expensive first, compared with previous"""
+        import pyRestTable
+
+        report = report or self.report()
+        before = (previous or {}).get("modules", {})
+        table = pyRestTable.Table()
+        table.labels = "module time_s change_s CA_calls memory_MB".split()
+        modules = report["modules"]
+        for name in sorted(
+            modules, key=lambda k: modules[k]["time"], reverse=True
+        ):
+            rec = modules[name]
+            change = ""
+            if name in before:
+                change = f"{rec['time'] - before[name]['time']:+.3f}"
+            table.addRow(
+                (
+                    name,
+                    f"{rec['time']:.3f}",
+                    change,
+                    rec["ca_calls"],
+                    f"{rec['memory'] / 2 ** 20:.1f}",
+                )
+            )
+        change = ""
+        if "total_time" in (previous or {}):
+            change = f"{report['total_time'] - previous['total_time']:+.3f}"
+        table.addRow(
+            (
+                "TOTAL",
+                f"{report['total_time']:.3f}",
+                change,
+                report["ca_calls"],
+                "",
+            )
+        )
+        return table
+
+    def finish(self, filename=None, show=True):
+        """stop recording, save report, show table (compare with previous)"""
+        from .session_logs import logger
+
+        self.stop()
+        filename = filename or REPORT_FILE
+        previous_file = filename.replace(".json", ".previous.json")
+        previous = None
+        if os.path.exists(filename):
+            os.replace(filename, previous_file)
+            try:
+                with open(previous_file) as f:
+                    previous = json.load(f)
+            except ValueError as exc:
+                logger.warning("could not read %s: %s", previous_file, exc)
+
+        report = self.report()
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "w") as f:
+            json.dump(report, f, indent=2)
+
+        table = self.table(report, previous)
+        logger.info("startup profile (%s):\n%s", filename, table)
+        if show:
+            print(table)
+        return report
+
+
+startup_profiler = StartupProfiler()
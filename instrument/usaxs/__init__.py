@@ -8,4 +8,5 @@ except RuntimeError:
 from .motors import *
 from .scalers import *
 from .tune_guard_slits import *
+from .tune_history import *
 from .issues import *
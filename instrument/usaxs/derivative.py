@@ -1,9 +1,15 @@
 """
 derivative of two vectors: y(x), returns y'(x)
+
+Also for many scans at once: ``numerical_derivative_batch()`` takes
+2-D arrays (one scan per row) or lists of scans of different lengths,
+optionally smoothing y (Savitzky-Golay) first.
 """
 
 __all__ = [
     "numerical_derivative",
+    "numerical_derivative_batch",
+    "savgol_smooth",
 ]
 
 from ..session_logs import logger
@@ -13,6 +19,8 @@ logger.info(__file__)
 
 import numpy as np
 
+MINIMUM_POINTS = 10
+
 
 def numerical_derivative(x, y):
     """
@@ -20,17 +28,144 @@ def numerical_derivative(x, y):
 
     here, xp is at midpoints of x
     """
-    if len(x) < 10:
+    if len(x) < MINIMUM_POINTS:
         raise ValueError(f"Need more points to analyze, received {len(x)}")
     if len(x) != len(y):
         raise ValueError(
             f"X & Y arrays must be same length to analyze, x:{len(x)} y:{len(y)}"
         )
-    x1 = np.array(x[:-1])  # all but the last
-    x2 = np.array(x[1:])  # all but the first
-    y1 = np.array(y[:-1])  # ditto
-    y2 = np.array(y[1:])
+    x = np.asarray(x, dtype=float)
+    dx = np.diff(x)
     # let numpy do this work with arrays
-    xp = (x2 + x1) / 2  # midpoint
-    yp = (y2 - y1) / (x2 - x1)  # slope
+    xp = x[:-1] + dx / 2  # midpoint
+    yp = np.diff(np.asarray(y, dtype=float)) / dx  # slope
     return xp, yp
+
+
+def _savgol_coefficients(window, polyorder):
+    """
+    weights of the least-squares polynomial values in a window
+
+    Row ``k`` of the returned (window x window) matrix gives the fitted
+    value at point ``k`` of the window: the middle row for the points
+    of a scan, the first and last rows for the points near its ends.
+    """
+    if window % 2 != 1 or window <= polyorder:
+        raise ValueError(
+            f"window ({window}) must be odd and larger than"
+            f" polyorder ({polyorder})"
+        )
+    half = window // 2
+    vandermonde = np.vander(
+        np.arange(-half, half + 1), polyorder + 1, increasing=True
+    )
+    return vandermonde @ np.linalg.pinv(vandermonde)
+
+
+def savgol_smooth(y, lengths, window=5, polyorder=2):
+    """
+    Savitzky-Golay smoothing of the scans in flat array ``y``
+
+    PARAMETERS
+
+    y : 1-D array
+        the scans, one after the other
+    lengths : 1-D array of int
+        number of points in each scan (at least ``window``)
+    window : int
+        (odd) number of points in each least-squares fit
+    polyorder : int
+        order of the fitted polynomial
+
+    Near the ends of each scan, the polynomial fitted to the first
+    (or last) ``window`` points of that scan gives the values (the
+    smoothing does not reach into the neighboring scans).
+    """
+    coefficients = _savgol_coefficients(window, polyorder)
+    half = window // 2
+    y = np.asarray(y, dtype=float)
+    lengths = np.asarray(lengths)
+    if len(lengths) > 0 and lengths.min() < window:
+        raise ValueError(
+            f"scans must have at least window ({window}) points,"
+            f" received {lengths.min()}"
+        )
+    smoothed = np.empty_like(y)
+    # all windows at once, the ones across two scans are replaced below
+    smoothed[half : len(y) - half] = np.convolve(
+        y, coefficients[half, ::-1], mode="valid"
+    )
+    if half > 0:
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        first = starts[:, None] + np.arange(window)
+        last = ends[:, None] - window + np.arange(window)
+        smoothed[first[:, :half]] = y[first] @ coefficients[:half].T
+        smoothed[last[:, -half:]] = y[last] @ coefficients[-half:].T
+    return smoothed
+
+
+def numerical_derivative_batch(x, y, window=None, polyorder=2):
+    """
+    first derivatives of many scans y(x), returns tuple (xp, yp)
+
+    PARAMETERS
+
+    x : 2-D array, 1-D array, or list of 1-D arrays
+        positions: one row per scan, the same for all scans (1-D,
+        with 2-D ``y``), or a list of scans (may differ in length)
+    y : 2-D array or list of 1-D arrays
+        values: one row per scan, or a list of scans (as ``x``)
+    window : int
+        (optional) smooth y first (Savitzky-Golay), with this (odd)
+        number of points in each fit
+    polyorder : int
+        order of the smoothing polynomial
+
+    With 2-D ``y``, xp & yp are 2-D arrays (one row per scan, one
+    column less).  With lists, xp & yp are lists of 1-D arrays.
+    Here, xp is at midpoints of x.
+    """
+    if len(y) == 0:
+        raise ValueError("Need at least one scan to analyze, received none")
+    if isinstance(y, np.ndarray) and y.ndim == 2:
+        x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+        y = np.asarray(y, dtype=float)
+        num_scans, num_points = y.shape
+        if num_points < MINIMUM_POINTS:
+            raise ValueError(
+                f"Need more points to analyze, received {num_points}"
+            )
+        if window is not None:
+            y = savgol_smooth(
+                y.ravel(), np.full(num_scans, num_points), window, polyorder
+            ).reshape(y.shape)
+        dx = np.diff(x, axis=-1)
+        xp = x[:, :-1] + dx / 2  # midpoints
+        yp = np.diff(y, axis=-1) / dx  # slopes
+        return xp, yp
+
+    # scans of different lengths: all at once, one after the other
+    lengths = np.array([len(v) for v in y])
+    for i, (xs, n) in enumerate(zip(x, lengths)):
+        if n < MINIMUM_POINTS:
+            raise ValueError(f"scan {i}: Need more points, received {n}")
+        if len(xs) != n:
+            raise ValueError(
+                f"scan {i}: X & Y must be same length, x:{len(xs)} y:{n}"
+            )
+    if len(x) != len(lengths):
+        raise ValueError(f"{len(x)} x scans but {len(lengths)} y scans")
+    x = np.concatenate(x).astype(float, copy=False)
+    y = np.concatenate(y).astype(float, copy=False)
+    if window is not None:
+        y = savgol_smooth(y, lengths, window, polyorder)
+    dx = np.diff(x)
+    xp = x[:-1] + dx / 2
+    with np.errstate(divide="ignore", invalid="ignore"):  # at boundaries
+        yp = np.diff(y) / dx
+    # drop the differences across the boundaries of two scans
+    keep = np.ones(len(dx), dtype=bool)
+    keep[np.cumsum(lengths)[:-1] - 1] = False
+    splits = np.cumsum(lengths - 1)[:-1]
+    return np.split(xp[keep], splits), np.split(yp[keep], splits)
@@ -0,0 +1,345 @@
+"""
+streaming edge statistics: tune a slit blade, stop once the edge is known
+
+``peak_center(*numerical_derivative(x, y))`` analyzes a blade scan once
+all of its points are collected.  :class:`EdgeStatistics` is a callback
+that keeps the same moments of the derivative (``sum_y``, ``sum_yx``,
+``sum_yxx``), updated as each event arrives, with the largest slope
+(the derivative peak).  Its ``done`` property is the stopping rule:
+the edge was crossed and the signal stayed flat past it, while the
+center and width moved less than ``tolerance`` (a fraction of the
+width) for ``settle_points`` points.
+
+:func:`edge_scan` is a step scan that ends when ``stats.done``, so the
+points past the edge are not counted.
+
+:func:`adaptive_edge_scan` scans a few (coarse) points over the whole
+range first, then evenly spaced (fine) points only where the signal
+changed, as :func:`edge_region` finds.
+
+EXAMPLE::
+
+    stats = EdgeStatistics("guard_slit_top", "upd2", min_change=500)
+    yield from edge_scan([scaler0], guard_slit.top, 0.1, -0.4, 61, stats)
+    stats.center, stats.width
+"""
+
+__all__ = """
+    adaptive_edge_scan
+    EdgeStatistics
+    edge_region
+    edge_scan
+""".split()
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+from bluesky import plan_stubs as bps
+from bluesky import preprocessors as bpp
+from collections import deque
+import math
+import numpy as np
+
+from .derivative import MINIMUM_POINTS
+
+SETTLE_POINTS = 5  # flat points past the edge before the scan may stop
+TOLERANCE = 0.02  # largest change of center & width (fraction of width)
+COARSE_POINTS = 13  # points of the coarse pass (adaptive_edge_scan)
+EDGE_FRACTION = 0.05  # coarse steps larger than this (of the change) are edge
+
+
+class EdgeStatistics:
+    """
+    running statistics of the derivative of ``y_name`` vs. ``x_name``
+
+    PARAMETERS
+
+    x_name : str
+        name of the positioner (readback) in the event data
+    y_name : str
+        name of the signal in the event data
+    min_change : float
+        smallest change of the signal that counts as crossing the edge
+    tolerance : float
+        largest change (fraction of the width) of center and width, and
+        of the signal (fraction of its total change), to stop
+    settle_points : int
+        number of points that must meet ``tolerance`` to stop
+
+    The center and width are those of ``peak_center()`` of the
+    derivative of all the points received.
+    """
+
+    def __init__(
+        self,
+        x_name,
+        y_name,
+        min_change=0,
+        tolerance=TOLERANCE,
+        settle_points=SETTLE_POINTS,
+    ):
+        self.x_name = x_name
+        self.y_name = y_name
+        self.min_change = min_change
+        self.tolerance = tolerance
+        self.settle_points = max(settle_points, 1)
+        self.clear()
+
+    def clear(self):
+        """forget all points"""
+        self.x_data = []
+        self.y_data = []
+        self.sum_y = 0.0
+        self.sum_yx = 0.0
+        self.sum_yxx = 0.0
+        self.peak_index = None  # derivative point with the largest slope
+        self.peak_position = None
+        self._peak_slope = 0.0
+        self._history = deque(maxlen=self.settle_points + 1)
+
+    def __call__(self, name, doc):
+        if name == "start":
+            self.clear()
+        elif name == "event":
+            data = doc["data"]
+            if self.x_name in data and self.y_name in data:
+                self.add(data[self.x_name], data[self.y_name])
+
+    def add(self, x, y):
+        """add one point, update the statistics"""
+        self.x_data.append(x)
+        self.y_data.append(y)
+        if len(self.x_data) < 2:
+            return
+        x1, x2 = self.x_data[-2:]
+        y1, y2 = self.y_data[-2:]
+        if x1 == x2:
+            return  # no slope (the derivative would not be finite)
+        xp = (x1 + x2) / 2  # midpoint
+        yp = (y2 - y1) / (x2 - x1)  # slope
+        self.sum_y += yp
+        self.sum_yx += yp * xp
+        self.sum_yxx += yp * xp * xp
+        if abs(yp) > abs(self._peak_slope):
+            self._peak_slope = yp
+            self.peak_index = len(self.x_data) - 2
+            self.peak_position = xp
+        self._history.append((self.center, self.width))
+
+    @property
+    def center(self):
+        """center of the derivative (as ``peak_center()``)"""
+        if self.sum_y == 0:
+            return math.nan
+        return self.sum_yx / self.sum_y
+
+    @property
+    def width(self):
+        """2 * sqrt(variance) of the derivative (as ``peak_center()``)"""
+        if self.sum_y == 0:
+            return math.nan
+        x_bar = self.sum_yx / self.sum_y
+        return 2 * math.sqrt(abs(self.sum_yxx / self.sum_y - x_bar * x_bar))
+
+    @property
+    def change(self):
+        """change of the signal from the first to the last point"""
+        if len(self.y_data) == 0:
+            return 0
+        return abs(self.y_data[-1] - self.y_data[0])
+
+    @property
+    def done(self):
+        """True when the edge, and its width, are known (stop the scan)"""
+        n = len(self.y_data)
+        if n <= max(MINIMUM_POINTS, self.settle_points + 1):
+            return False
+        change = self.change
+        if change == 0 or change < self.min_change:
+            return False  # edge not crossed yet
+        if self.peak_index is None or self.peak_index >= n - 1 - (
+            self.settle_points
+        ):
+            return False  # largest slope is too recent
+        recent = self.y_data[-self.settle_points - 1 :]
+        steps = np.abs(np.diff(np.asarray(recent, dtype=float)))
+        if steps.max() > self.tolerance * change:
+            return False  # not flat past the edge
+        if len(self._history) <= self.settle_points:
+            return False
+        centers, widths = np.array(self._history, dtype=float).T
+        limit = self.tolerance * widths[-1]
+        if not np.isfinite(limit) or limit == 0:
+            return False
+        return bool(
+            np.ptp(centers) <= limit and np.ptp(widths) <= limit
+        )
+
+
+def edge_scan(
+    detectors, motor, start, end, num, stats, stop_early=True, md=None
+):
+    """
+    plan: step scan of ``motor``, stops when ``stats.done``
+
+    PARAMETERS
+
+    detectors : list
+        readable devices to count at each point
+    motor : positioner
+        moved from ``start`` to ``end`` in ``num`` evenly spaced points
+    stats : EdgeStatistics
+        receives the documents of the scan, decides when to stop
+    stop_early : bool
+        ``False``: scan all ``num`` points
+
+    The statistics are updated (as each event is emitted) before the
+    next point is started.
+    """
+    detectors = list(detectors)
+    positions = np.linspace(start, end, num)
+    _md = dict(
+        detectors=[det.name for det in detectors],
+        motors=[motor.name],
+        plan_name="edge_scan",
+        plan_args=dict(
+            detectors=list(map(repr, detectors)),
+            motor=repr(motor),
+            start=start,
+            end=end,
+            num=num,
+        ),
+        plan_pattern="linspace",
+        plan_pattern_module="numpy",
+        plan_pattern_args=dict(start=start, stop=end, num=num),
+        hints=dict(dimensions=[([motor.name], "primary")]),
+    )
+    _md.update(md or {})
+
+    @bpp.subs_decorator(stats)
+    @bpp.stage_decorator(detectors + [motor])
+    @bpp.run_decorator(md=_md)
+    def _inner():
+        for i, position in enumerate(positions):
+            yield from bps.mv(motor, position)
+            yield from bps.trigger_and_read(detectors + [motor])
+            if stop_early and stats.done:
+                logger.info(
+                    "%s: edge found after %d of %d points,"
+                    " center=%g width=%g",
+                    motor.name,
+                    i + 1,
+                    num,
+                    stats.center,
+                    stats.width,
+                )
+                break
+
+    return (yield from _inner())
+
+
+def edge_region(x, y, fraction=EDGE_FRACTION):
+    """
+    ``(first, last)`` positions of ``x`` that bracket the edge in ``y``
+
+    The edge is where a step of ``y`` is larger than ``fraction`` of the
+    change from the first to the last point, with one more step on each
+    side.  ``(x[0], x[-1])`` if there is no edge.
+    """
+    y = np.asarray(y, dtype=float)
+    steps = np.abs(np.diff(y))
+    change = abs(y[-1] - y[0])
+    edge = np.flatnonzero(steps > fraction * change)
+    if change == 0 or len(edge) == 0:
+        return x[0], x[-1]
+    first = max(edge[0] - 1, 0)
+    last = min(edge[-1] + 2, len(x) - 1)
+    return x[first], x[last]
+
+
+def adaptive_edge_scan(
+    detectors,
+    motor,
+    start,
+    end,
+    num,
+    signal_name,
+    min_change=0,
+    coarse_points=COARSE_POINTS,
+    md=None,
+):
+    """
+    plan: coarse scan over the range, then fine scan of the edge
+
+    PARAMETERS
+
+    detectors : list
+        readable devices to count at each point
+    motor : positioner
+        moved from ``start`` to ``end``
+    num : int
+        the fine points are spaced as ``num`` points from start to end
+    signal_name : str
+        name of the signal (in ``detectors``) that has the edge
+    min_change : float
+        no fine scan if the signal changed less than this over the range
+    coarse_points : int
+        number of points in the coarse scan
+
+    Returns ``(x, y)`` of the fine scan (of the coarse scan if there
+    was no fine scan).  Positions of the fine scan are evenly spaced,
+    for ``numerical_derivative()`` and ``peak_center()``.
+
+    With ``num`` no more than ``coarse_points + MINIMUM_POINTS``, the
+    two passes would count more points than ``num``: the range is
+    scanned once, with ``num`` points.
+    """
+    if num <= coarse_points + MINIMUM_POINTS:
+        stats = EdgeStatistics(motor.name, signal_name)
+        yield from edge_scan(
+            detectors, motor, start, end, num, stats, stop_early=False, md=md
+        )
+        return stats.x_data, stats.y_data
+
+    _md = dict(tune_pass="coarse")
+    _md.update(md or {})
+    coarse = EdgeStatistics(motor.name, signal_name)
+    yield from edge_scan(
+        detectors,
+        motor,
+        start,
+        end,
+        coarse_points,
+        coarse,
+        stop_early=False,
+        md=_md,
+    )
+    if coarse.change == 0 or coarse.change < min_change:
+        return coarse.x_data, coarse.y_data
+
+    first, last = edge_region(coarse.x_data, coarse.y_data)
+    spacing = abs(end - start) / max(num - 1, 1)
+    fine_points = max(
+        int(round(abs(last - first) / spacing)) + 1, MINIMUM_POINTS + 1
+    )
+    logger.info(
+        "%s: edge between %g and %g, scan %d points there",
+        motor.name,
+        first,
+        last,
+        fine_points,
+    )
+    _md.update(tune_pass="fine")
+    fine = EdgeStatistics(motor.name, signal_name)
+    yield from edge_scan(
+        detectors,
+        motor,
+        first,
+        last,
+        fine_points,
+        fine,
+        stop_early=False,
+        md=_md,
+    )
+    return fine.x_data, fine.y_data
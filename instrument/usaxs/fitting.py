@@ -0,0 +1,273 @@
+"""
+least-squares fits of edges & peaks, many scans at once
+
+Fits a model to each scan, all scans together (arrays of scans, one
+row each), with Levenberg-Marquardt steps:
+
+============  ==================================================
+model         y(x)
+============  ==================================================
+erf           background + amplitude * (1 + erf(z / sqrt(2))) / 2
+gaussian      background + amplitude * exp(-z * z / 2)
+lorentzian    background + amplitude / (1 + z * z)
+============  ==================================================
+
+where ``z = (x - center) / width``.  Each fit returns center, width,
+amplitude, background, and their (1-sigma) uncertainties.  The width of
+an edge (erf) or gaussian is the standard deviation, of a lorentzian
+the half width at half maximum.
+
+EXAMPLE::
+
+    fit = fit_edge(x, y)
+    if fit.success:
+        print(f"edge at {fit.center} +/- {fit.center_error}")
+
+    fits = fit_batch(x_scans, y_scans, model="gaussian")
+    fits.center  # one for each scan
+"""
+
+__all__ = """
+    erf
+    fit_batch
+    fit_edge
+    fit_peak
+    FitResult
+""".split()
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+import collections
+import math
+import numpy as np
+
+MAX_ITERATIONS = 100
+TOLERANCE = 1e-8  # relative change of all parameters to stop
+MODELS = ("erf", "gaussian", "lorentzian")
+NUM_PARAMETERS = 4  # center, width, amplitude, background
+
+FitResult = collections.namedtuple(
+    "FitResult",
+    """
+    center width amplitude background
+    center_error width_error amplitude_error background_error
+    chisqr success
+    """.split(),
+)
+
+
+def erf(x):
+    """error function of array ``x`` (absolute error below 1.5e-7)"""
+    # Abramowitz & Stegun, equation 7.1.26
+    x = np.asarray(x, dtype=float)
+    a = np.abs(x)
+    t = 1 / (1 + 0.3275911 * a)
+    poly = t * (
+        0.254829592
+        + t
+        * (
+            -0.284496736
+            + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))
+        )
+    )
+    return np.sign(x) * (1 - poly * np.exp(-a * a))
+
+
+def _model(model, x, p):
+    """values (scans, points) & derivatives (scans, points, parameters)"""
+    center, width, amplitude, background = (p[:, [i]] for i in range(4))
+    z = (x - center) / width
+    jacobian = np.empty(x.shape + (NUM_PARAMETERS,))
+    if model == "erf":
+        shape = (1 + erf(z / math.sqrt(2))) / 2
+        slope = amplitude * np.exp(-z * z / 2) / math.sqrt(2 * math.pi)
+        jacobian[..., 0] = -slope / width
+        jacobian[..., 1] = -slope * z / width
+    elif model == "gaussian":
+        shape = np.exp(-z * z / 2)
+        jacobian[..., 0] = amplitude * shape * z / width
+        jacobian[..., 1] = amplitude * shape * z * z / width
+    else:  # lorentzian
+        shape = 1 / (1 + z * z)
+        jacobian[..., 0] = 2 * amplitude * shape * shape * z / width
+        jacobian[..., 1] = 2 * amplitude * shape * shape * z * z / width
+    jacobian[..., 2] = shape
+    jacobian[..., 3] = 1
+    return background + amplitude * shape, jacobian
+
+
+def _padded(x, y):
+    """2-D arrays x, y, and mask (of the points) from arrays or lists"""
+    if isinstance(y, np.ndarray) and y.ndim == 2:
+        y = np.asarray(y, dtype=float)
+        x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+        return x, y, np.ones(y.shape, dtype=bool)
+    lengths = [len(v) for v in y]
+    if len(x) != len(y):
+        raise ValueError(f"{len(x)} x scans but {len(y)} y scans")
+    shape = (len(y), max(lengths))
+    xs, ys = np.zeros(shape), np.zeros(shape)
+    mask = np.zeros(shape, dtype=bool)
+    for i, (u, v, n) in enumerate(zip(x, y, lengths)):
+        if len(u) != n:
+            raise ValueError(
+                f"scan {i}: X & Y must be same length, x:{len(u)} y:{n}"
+            )
+        xs[i, :n], ys[i, :n], mask[i, :n] = u, v, True
+    return xs, ys, mask
+
+
+def _initial(model, x, y, mask):
+    """first guess of the parameters, from moments of the data"""
+    low = np.where(mask, x, np.inf).argmin(axis=1)
+    high = np.where(mask, x, -np.inf).argmax(axis=1)
+    rows = np.arange(len(y))
+    y_min = np.where(mask, y, np.inf).min(axis=1)
+    y_max = np.where(mask, y, -np.inf).max(axis=1)
+    if model == "erf":
+        # moments of the (absolute) steps of y, at the midpoints
+        pairs = mask[:, 1:] & mask[:, :-1]
+        weight = np.where(pairs, np.abs(np.diff(y, axis=1)), 0)
+        position = (x[:, 1:] + x[:, :-1]) / 2
+        background = y[rows, low]
+        amplitude = y[rows, high] - y[rows, low]
+    else:
+        background = y_min
+        amplitude = y_max - y_min
+        weight = np.where(mask, y - background[:, None], 0)
+        position = x
+    total = weight.sum(axis=1)
+    total = np.where(total > 0, total, 1)
+    center = (weight * position).sum(axis=1) / total
+    variance = (weight * (position - center[:, None]) ** 2).sum(axis=1)
+    span = x[rows, high] - x[rows, low]
+    width = np.clip(np.sqrt(variance / total), 1e-3 * span, span)
+    if model != "erf":
+        center = x[rows, np.where(mask, y, -np.inf).argmax(axis=1)]
+    return np.stack([center, width, amplitude, background], axis=1)
+
+
+def fit_batch(x, y, model="erf", counts=True):
+    """
+    fit ``model`` to each scan, returns a FitResult of arrays
+
+    PARAMETERS
+
+    x : 2-D array, 1-D array, or list of 1-D arrays
+        positions: one row per scan, the same for all scans (1-D,
+        with 2-D ``y``), or a list of scans (may differ in length)
+    y : 2-D array or list of 1-D arrays
+        values: one row per scan, or a list of scans (as ``x``)
+    model : str
+        ``"erf"`` (edge), ``"gaussian"``, or ``"lorentzian"`` (peak)
+    counts : bool
+        y are counts: weight each point by its (Poisson) uncertainty,
+        ``sqrt(y)``
+
+    ``chisqr`` is the reduced chi-square (weighted, with ``counts``).
+    ``success`` is False for a scan if its fit did not give a finite
+    center within the scan (and a finite, positive width).
+    """
+    if model not in MODELS:
+        raise ValueError(f"unknown model: {model}")
+    x, y, mask = _padded(x, y)
+    num_points = mask.sum(axis=1)
+    if num_points.min() <= NUM_PARAMETERS:
+        raise ValueError(
+            f"Need more points to fit, received {num_points.min()}"
+        )
+
+    # fit in units of the scan range (x) & signal range (y)
+    x_lo = np.where(mask, x, np.inf).min(axis=1)
+    x_hi = np.where(mask, x, -np.inf).max(axis=1)
+    x_scale = np.where(x_hi > x_lo, x_hi - x_lo, 1)
+    y_lo = np.where(mask, y, np.inf).min(axis=1)
+    y_hi = np.where(mask, y, -np.inf).max(axis=1)
+    y_scale = np.where(y_hi > y_lo, y_hi - y_lo, 1)
+    u = np.where(mask, (x - x_lo[:, None]) / x_scale[:, None], 0)
+    v = np.where(mask, (y - y_lo[:, None]) / y_scale[:, None], 0)
+    if counts:
+        weight = y_scale[:, None] / np.sqrt(np.maximum(y, 1))
+    else:
+        weight = np.ones(y.shape)
+    weight = np.where(mask, weight, 0)
+
+    p = _initial(model, u, v, mask)
+    damping = np.full(len(p), 1e-3)
+    active = np.ones(len(p), dtype=bool)  # not converged yet
+    identity = np.eye(NUM_PARAMETERS)
+
+    def residuals(p):
+        f, jacobian = _model(model, u, p)
+        return (v - f) * weight, jacobian * weight[..., None]
+
+    r, jacobian = residuals(p)
+    chisqr = (r * r).sum(axis=1)
+    for _ in range(MAX_ITERATIONS):
+        jtj = np.einsum("nmi,nmj->nij", jacobian, jacobian)
+        jtr = np.einsum("nmi,nm->ni", jacobian, r)
+        diagonal = np.einsum("nii->ni", jtj)
+        a = jtj + identity * (damping[:, None] * diagonal + 1e-12)[:, None]
+        step = np.linalg.solve(a, jtr[..., None])[..., 0]
+        step[~active] = 0
+        trial = p + step
+        trial[:, 1] = np.abs(trial[:, 1])  # the width is positive
+        with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+            r_trial, j_trial = residuals(trial)
+            chi_trial = (r_trial * r_trial).sum(axis=1)
+        better = active & np.isfinite(chi_trial) & (chi_trial <= chisqr)
+        p[better] = trial[better]
+        r[better], jacobian[better] = r_trial[better], j_trial[better]
+        small = np.all(
+            np.abs(step) <= TOLERANCE * (np.abs(p) + TOLERANCE), axis=1
+        )
+        active &= ~(better & small)
+        chisqr = np.where(better, chi_trial, chisqr)
+        damping = np.where(better, damping / 10, damping * 10)
+        active &= damping < 1e10  # no step makes it better
+        if not active.any():
+            break
+
+    # uncertainties: covariance scaled by the reduced chi-square
+    dof = num_points - NUM_PARAMETERS
+    reduced = chisqr / dof
+    jtj = np.einsum("nmi,nmj->nij", jacobian, jacobian)
+    with np.errstate(invalid="ignore"):
+        covariance = np.linalg.pinv(jtj) * reduced[:, None, None]
+        errors = np.sqrt(np.einsum("nii->ni", covariance))
+
+    # back to the units of x & y
+    scale = np.stack([x_scale, x_scale, y_scale, y_scale], axis=1)
+    zero = np.zeros_like(x_lo)
+    offset = np.stack([x_lo, zero, zero, y_lo], axis=1)
+    p = p * scale + offset
+    errors = errors * scale
+    center, width = p[:, 0], p[:, 1]
+    success = (
+        np.isfinite(p).all(axis=1)
+        & np.isfinite(errors[:, :2]).all(axis=1)
+        & (width > 0)
+        & (x_lo <= center)
+        & (center <= x_hi)
+    )
+    if not counts:
+        reduced = reduced * y_scale**2
+    return FitResult(*p.T, *errors.T, chisqr=reduced, success=success)
+
+
+def _single(x, y, model, counts):
+    """fit one scan, returns a FitResult of numbers"""
+    fit = fit_batch([x], [y], model=model, counts=counts)
+    return FitResult(*(v[0] for v in fit[:-1]), success=bool(fit.success[0]))
+
+
+def fit_edge(x, y, counts=True):
+    """fit an edge (erf) to y(x), returns FitResult"""
+    return _single(x, y, "erf", counts)
+
+
+def fit_peak(x, y, model="gaussian", counts=True):
+    """fit a peak (``"gaussian"`` or ``"lorentzian"``), returns FitResult"""
+    return _single(x, y, model, counts)
@@ -0,0 +1,188 @@
+"""
+fly scan: count while the motor moves, place each count from timestamps
+
+A step scan pays, at each point, for a motor move, its settling, and
+the count.  :func:`fly_scan` moves the motor once, at constant
+velocity, from start to end, and counts (again and again) while it
+moves.  The motor readback is monitored.  Each count is placed at the
+position the motor had in the middle of the count, interpolated from
+the timestamps of the readback updates and the time the count ended
+(its trigger finished).  The tunes analyze these positions & counts
+as those of a step scan.
+
+The first count, before the move, measures the time of one count
+(with its dead time), which sets the velocity.  The motor record may
+change the velocity (such as up to its base velocity, ``VBAS``): the
+velocity read back is the one reported.
+
+EXAMPLE::
+
+    x, y = yield from fly_scan(
+        [scaler0], guard_slit.top, 0.1, -0.4, "upd2", 61, 0.25
+    )
+    position, width = peak_center(*numerical_derivative(x, y))
+"""
+
+__all__ = """
+    fly_scan
+    fly_positions
+""".split()
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+from bluesky import plan_stubs as bps
+from bluesky import preprocessors as bpp
+import numpy as np
+import time
+
+MIN_STEP = 0.5  # fraction of a step, closer counts are not used
+
+
+def fly_positions(count_times, count_time, readback_times, readbacks):
+    """
+    position of the motor in the middle of each count
+
+    PARAMETERS
+
+    count_times : 1-D array
+        timestamps of the counts (when each count ended)
+    count_time : float
+        duration (s) of each count
+    readback_times : 1-D array
+        timestamps of the motor readback updates
+    readbacks : 1-D array
+        the motor readback values
+    """
+    readback_times = np.asarray(readback_times, dtype=float)
+    order = np.argsort(readback_times, kind="stable")
+    middle = np.asarray(count_times, dtype=float) - count_time / 2
+    return np.interp(
+        middle, readback_times[order], np.asarray(readbacks)[order]
+    )
+
+
+def fly_scan(
+    detectors, motor, start, end, signal_name, num, count_time, md=None
+):
+    """
+    plan: count ``detectors`` while ``motor`` moves from start to end
+
+    PARAMETERS
+
+    detectors : list
+        readable devices, counted again and again during the move
+    motor : positioner
+        has ``velocity`` and ``user_readback`` (as ``EpicsMotor``)
+    signal_name : str
+        name of the signal (in ``detectors``) to return
+    num : int
+        about this many counts during the move (sets the velocity)
+    count_time : float
+        duration (s) of each count (as the scaler's ``preset_time``)
+
+    Returns ``(x, y)``: the position of each count (in order of the
+    move, without counts closer than ``MIN_STEP`` of a step to the one
+    before) and the counts.  The motor velocity is restored after the
+    scan.
+    """
+    detectors = list(detectors)
+    old_velocity = motor.velocity.get()
+    readbacks = []  # (timestamp, position)
+    counts = []  # (timestamp, counts)
+    velocity = None  # as read back from the motor
+
+    def monitor(value=None, timestamp=None, **kwargs):
+        readbacks.append((timestamp, value))
+
+    _md = dict(
+        detectors=[det.name for det in detectors],
+        motors=[motor.name],
+        plan_name="fly_scan",
+        plan_args=dict(
+            detectors=list(map(repr, detectors)),
+            motor=repr(motor),
+            start=start,
+            end=end,
+            num=num,
+            count_time=count_time,
+        ),
+        hints=dict(dimensions=[([motor.name], "primary")]),
+    )
+    _md.update(md or {})
+
+    def count():
+        """plan: count once, keep the time its trigger finished"""
+        for det in detectors:
+            yield from bps.trigger(det, group="fly-count")
+        yield from bps.wait(group="fly-count")
+        finished = time.time()
+        # a scaler channel's timestamp is that of its last CA update,
+        # none is posted when the counts do not change
+        yield from bps.create("primary")
+        reading = {}
+        for obj in detectors + [motor]:
+            reading.update((yield from bps.read(obj)))
+        yield from bps.save()
+        counts.append((finished, reading[signal_name]["value"]))
+        readbacks.append(
+            (reading[motor.name]["timestamp"], reading[motor.name]["value"])
+        )
+
+    @bpp.stage_decorator(detectors + [motor])
+    @bpp.run_decorator(md=_md)
+    def _inner():
+        nonlocal velocity
+        yield from bps.mv(motor, start)
+        t0 = time.time()
+        yield from count()  # at start, and the time of one count
+        cycle = max(time.time() - t0, count_time, 1e-9)
+        requested = abs(end - start) / (num * cycle)
+        yield from bps.mv(motor.velocity, requested)
+        velocity = yield from bps.rd(motor.velocity)
+        if not np.isclose(velocity, requested, rtol=0.01):
+            logger.warning(
+                "%s: velocity is %g, not %g (limited by the motor record)",
+                motor.name,
+                velocity,
+                requested,
+            )
+        cid = motor.user_readback.subscribe(monitor)
+        try:
+            status = yield from bps.abs_set(motor, end, group="fly")
+            while True:
+                done = status.done  # count once more after the move
+                yield from count()
+                if done:
+                    break
+            yield from bps.wait(group="fly")
+        finally:
+            motor.user_readback.unsubscribe(cid)
+
+    def _restore():
+        yield from bps.mv(motor.velocity, old_velocity)
+
+    yield from bpp.finalize_wrapper(_inner(), _restore())
+
+    t, y = np.array(counts, dtype=float).reshape(-1, 2).T
+    t_rb, x_rb = np.array(readbacks, dtype=float).reshape(-1, 2).T
+    x = fly_positions(t, count_time, t_rb, x_rb)
+    # counts (such as before the motor starts) too close to the last
+    # one would make the derivative noisy
+    min_step = MIN_STEP * abs(end - start) / max(num - 1, 1)
+    keep = np.zeros(len(x), dtype=bool)
+    last = None
+    for i, position in enumerate(x):
+        if last is None or abs(position - last) >= min_step:
+            keep[i] = True
+            last = position
+    logger.info(
+        "%s: fly scan from %g to %g, %d counts at %g units/s",
+        motor.name,
+        start,
+        end,
+        keep.sum(),
+        velocity,
+    )
+    return x[keep], y[keep]
@@ -20,6 +20,8 @@ from bluesky import plan_stubs as bps
 from ophyd import Component, EpicsMotor, EpicsSignal, MotorBundle, Signal
 import ophyd
 
+from ..utils.lazy_devices import lazy_device
+
 
 guard_h_size = Signal(name="guard_h_size", value=0.5, labels=["terms",])
 guard_v_size = Signal(name="guard_v_size", value=0.5, labels=["terms",])
@@ -92,6 +94,9 @@ class GSlitDevice(MotorBundle):
     h_step_into = 1.1  # 1.1mm step into the beam (blocks the beam)
     v_step_into = 0.4  # 0.4mm step into the beam (blocks the beam)
     tuning_intensity_threshold = 500
+    tune_mode = "stream"  # "stream", "adaptive", "fly", or "full" (step scan)
+    tune_tolerance = 0.02  # "stream": center & width known to this (of width)
+    tune_analysis = "fit"  # "fit" (erf, gaussian) or "moments" (as before)
 
     def set_size(self, *args, h=None, v=None):
         """move the slits to the specified size"""
@@ -135,5 +140,11 @@ class GSlitDevice(MotorBundle):
         self.inb.status_update._set_thread = None
 
 
-guard_slit = GSlitDevice("", name="guard_slit")
-usaxs_slit = UsaxsSlitDevice("", name="usaxs_slit")
+guard_slit = lazy_device(
+    "guard_slit", lambda: GSlitDevice("", name="guard_slit"), ioc="lax:"
+)
+usaxs_slit = lazy_device(
+    "usaxs_slit",
+    lambda: UsaxsSlitDevice("", name="usaxs_slit"),
+    ioc="lax:",
+)
@@ -19,36 +19,52 @@ logger.info(__file__)
 
 from ophyd import Component, EpicsSignal, EpicsScaler, EpicsSignalRO
 from ophyd.scaler import ScalerCH
+from ..utils.ioc_state import declare_ioc_value
+from ..utils.ioc_state import reconcile_ioc_state
+from ..utils.lazy_devices import lazy_component
+from ..utils.lazy_devices import lazy_device
 
 
 class myScalerCH(ScalerCH):
     display_rate = Component(EpicsSignal, ".RATE")
 
 
-scaler0 = myScalerCH("lax:scaler1", name="scaler0", labels=["detectors",])
+def _setup_scaler0(scaler):
+    channels = scaler.channels
+    declare_ioc_value(channels.chan01.chname, "clock")
+    declare_ioc_value(channels.chan02.chname, "I0")
+    declare_ioc_value(channels.chan03.chname, "I00")
+    declare_ioc_value(channels.chan06.chname, "I000")
+    declare_ioc_value(channels.chan04.chname, "upd2")
+    declare_ioc_value(channels.chan05.chname, "trd")
+    reconcile_ioc_state()  # select_channels() needs the names now
 
-CLOCK_SIGNAL = scaler0.channels.chan01
-I0_SIGNAL = scaler0.channels.chan02
-I00_SIGNAL = scaler0.channels.chan03
-UPD_SIGNAL = scaler0.channels.chan04
-TRD_SIGNAL = scaler0.channels.chan05
-I000_SIGNAL = scaler0.channels.chan06
+    scaler.select_channels(None)
 
-clock = CLOCK_SIGNAL.s
-I0 = I0_SIGNAL.s
-I00 = I00_SIGNAL.s
-upd2 = UPD_SIGNAL.s
-trd = TRD_SIGNAL.s
-I000 = I000_SIGNAL.s
+    for chan in "01 02 03 04 05 06".split():
+        item = getattr(channels, f"chan{chan}").s
+        item._ophyd_labels_ = set(["channel", "counter",])
 
-CLOCK_SIGNAL.chname.put("clock")
-I0_SIGNAL.chname.put("I0")
-I00_SIGNAL.chname.put("I00")
-I000_SIGNAL.chname.put("I000")
-UPD_SIGNAL.chname.put("upd2")
-TRD_SIGNAL.chname.put("trd")
 
-scaler0.select_channels(None)
+scaler0 = lazy_device(
+    "scaler0",
+    lambda: myScalerCH(
+        "lax:scaler1", name="scaler0", labels=["detectors",]
+    ),
+    _setup_scaler0,
+    ioc="lax:",
+)
 
-for item in (clock, I0, I00, upd2, trd, I000):
-    item._ophyd_labels_ = set(["channel", "counter",])
+CLOCK_SIGNAL = lazy_component(scaler0, "channels.chan01", "CLOCK_SIGNAL")
+I0_SIGNAL = lazy_component(scaler0, "channels.chan02", "I0_SIGNAL")
+I00_SIGNAL = lazy_component(scaler0, "channels.chan03", "I00_SIGNAL")
+UPD_SIGNAL = lazy_component(scaler0, "channels.chan04", "UPD_SIGNAL")
+TRD_SIGNAL = lazy_component(scaler0, "channels.chan05", "TRD_SIGNAL")
+I000_SIGNAL = lazy_component(scaler0, "channels.chan06", "I000_SIGNAL")
+
+clock = lazy_component(scaler0, "channels.chan01.s", "clock")
+I0 = lazy_component(scaler0, "channels.chan02.s", "I0")
+I00 = lazy_component(scaler0, "channels.chan03.s", "I00")
+upd2 = lazy_component(scaler0, "channels.chan04.s", "upd2")
+trd = lazy_component(scaler0, "channels.chan05.s", "trd")
+I000 = lazy_component(scaler0, "channels.chan06.s", "I000")
@@ -0,0 +1,205 @@
+"""
+simulated guard slit blade & scaler (no IOC), to try & benchmark tunes
+
+The :class:`SimulatedBladeMotor` moves in (real) time at its
+``velocity``, its readback updates while it moves, so it can be used
+for step scans and for fly scans.  The :class:`SimulatedScaler` counts
+for ``preset_time`` the beam that passes the blade (or a slit) at the
+positions the motor has during the count, with counting (Poisson)
+noise.  Its ``counts`` have the time the count ended as timestamp, as
+an EPICS scaler channel.
+
+EXAMPLE::
+
+    blade, scaler = simulated_blade(edge=0.1, width=0.02)
+    RE(edge_scan([scaler], blade, 0.3, -0.2, 61, stats))
+"""
+
+__all__ = """
+    SimulatedBladeMotor
+    SimulatedScaler
+    simulated_blade
+""".split()
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+from ophyd import Component, Device, Kind, Signal
+from ophyd.status import DeviceStatus
+import math
+import numpy as np
+import threading
+import time
+
+UPDATE_PERIOD = 0.02  # seconds between readback updates while moving
+SAMPLES_PER_COUNT = 16  # positions averaged over one count
+
+
+class SimulatedBladeMotor(Device):
+    """
+    motor that moves at constant ``velocity`` (units/s), in real time
+
+    PARAMETERS
+
+    settle_time : float
+        time (s) before and after each move, as the motor record's
+        acceleration, backlash, and settling
+    """
+
+    user_readback = Component(Signal, value=0.0, kind=Kind.hinted)
+    user_setpoint = Component(Signal, value=0.0)
+    velocity = Component(Signal, value=1.0, kind=Kind.config)
+
+    def __init__(self, *args, settle_time=0.1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user_readback.name = self.name
+        self.settle_time = settle_time
+        self._lock = threading.Lock()
+        self._trajectory = (time.time(), 0.0, 0.0, 1.0)  # t0, x0, x1, v
+
+    def position_at(self, t):
+        """position of the motor at time ``t``"""
+        t0, x0, x1, velocity = self._trajectory
+        if t <= t0:
+            return x0
+        distance = velocity * (t - t0)
+        if distance >= abs(x1 - x0):
+            return x1
+        return x0 + math.copysign(distance, x1 - x0)
+
+    @property
+    def position(self):
+        return self.position_at(time.time())
+
+    @property
+    def moving(self):
+        return self.position != self._trajectory[2]
+
+    def set(self, value):
+        """move to ``value``, returns a status"""
+        status = DeviceStatus(self)
+        with self._lock:
+            now = time.time()
+            self._trajectory = (
+                now + self.settle_time,
+                self.position_at(now),
+                float(value),
+                abs(self.velocity.get()) or 1.0,
+            )
+            trajectory = self._trajectory
+        self.user_setpoint.put(float(value))
+
+        def move():
+            while True:
+                now = time.time()
+                position = self.position_at(now)
+                self.user_readback.put(position, timestamp=now)
+                if self._trajectory is not trajectory:
+                    break  # stopped or moved again
+                if position == trajectory[2]:
+                    time.sleep(self.settle_time)
+                    break
+                time.sleep(UPDATE_PERIOD)
+            status.set_finished()
+
+        threading.Thread(target=move, daemon=True).start()
+        return status
+
+    def stop(self, *, success=False):
+        with self._lock:
+            position = self.position
+            self._trajectory = (time.time(), position, position, 1.0)
+        self.user_readback.put(position)
+
+
+class SimulatedScaler(Device):
+    """
+    scaler that counts the beam passing a blade (or a slit) at ``motor``
+
+    PARAMETERS
+
+    motor : SimulatedBladeMotor
+        the blade (or slit) that is moved through the beam
+    edge : float
+        motor position of the beam center
+    width : float
+        (gaussian) standard deviation of the beam profile
+    rate : float
+        counts per second of the whole beam
+    background : float
+        counts per second without beam
+    profile : str
+        ``"edge"``: the beam passes above ``edge``, ``"peak"``: a slit
+        (smaller than the beam) centered at ``edge`` passes it
+    """
+
+    preset_time = Component(Signal, value=1.0, kind=Kind.config)
+    counts = Component(Signal, value=0, kind=Kind.hinted)
+
+    def __init__(
+        self,
+        *args,
+        motor=None,
+        edge=0.0,
+        width=0.02,
+        rate=4e5,
+        background=20,
+        profile="edge",
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        if profile not in ("edge", "peak"):
+            raise ValueError(f"unknown profile: {profile}")
+        self.motor = motor
+        self.edge = edge
+        self.width = width
+        self.rate = rate
+        self.background = background
+        self.profile = profile
+        self._rng = np.random.default_rng()
+
+    def intensity(self, x):
+        """counts per second with the motor at ``x`` (array)"""
+        z = (np.asarray(x, dtype=float) - self.edge) / self.width
+        if self.profile == "edge":
+            erf = np.vectorize(math.erf)
+            fraction = 0.5 * (1 + erf(z / math.sqrt(2)))
+        else:
+            fraction = np.exp(-0.5 * z * z)
+        return self.background + self.rate * fraction
+
+    def trigger(self):
+        """count for ``preset_time``, returns a status"""
+        status = DeviceStatus(self)
+        preset_time = self.preset_time.get()
+
+        def count():
+            t0 = time.time()
+            time.sleep(preset_time)
+            t1 = time.time()
+            times = np.linspace(t0, t1, SAMPLES_PER_COUNT)
+            positions = [self.motor.position_at(t) for t in times]
+            expected = self.intensity(positions).mean() * preset_time
+            self.counts.put(int(self._rng.poisson(expected)), timestamp=t1)
+            status.set_finished()
+
+        threading.Thread(target=count, daemon=True).start()
+        return status
+
+
+def simulated_blade(
+    position=0.0, velocity=1.0, settle_time=0.1, preset_time=0.25, **kwargs
+):
+    """
+    a simulated blade (motor) and the scaler that sees it
+
+    ``kwargs`` are passed to :class:`SimulatedScaler`.
+    """
+    motor = SimulatedBladeMotor(name="sim_blade", settle_time=settle_time)
+    motor.velocity.put(velocity)
+    motor._trajectory = (time.time(), position, position, velocity)
+    motor.user_readback.put(position)
+    scaler = SimulatedScaler(name="sim_scaler", motor=motor, **kwargs)
+    scaler.preset_time.put(preset_time)
+    return motor, scaler
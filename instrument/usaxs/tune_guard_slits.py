@@ -15,13 +15,23 @@ logger.info(__file__)
 
 from apstools.plans import TuneAxis
 from bluesky import plan_stubs as bps
+from bluesky import preprocessors as bpp
 from collections import defaultdict
 from ophyd import Kind
 import datetime
+import math
 import pyRestTable
 
 from ..framework import RE
+from .derivative import MINIMUM_POINTS
 from .derivative import numerical_derivative
+from .edge_stats import adaptive_edge_scan
+from .edge_stats import EdgeStatistics
+from .edge_stats import EDGE_FRACTION
+from .edge_stats import edge_scan
+from .fitting import fit_edge
+from .fitting import fit_peak
+from .fly_scan import fly_scan
 from .motors import guard_slit, guard_h_size, guard_v_size
 from .peak_centers import peak_center
 from .scalers import (
@@ -31,17 +41,77 @@ from .scalers import (
     I00_SIGNAL,
     UPD_SIGNAL,
 )
+from .tune_history import tune_history
+
+PEAK_FACTOR = 4  # peak is this many times the lowest (fly scan tunes)
+GAP_HISTORY_KEY = "guard_slit_gap"  # tune_history: intensity after the tune
+FWHM_PER_SIGMA = 2 * math.sqrt(2 * math.log(2))  # of a gaussian
 
 
 class GuardSlitTuneError(RuntimeError):
     ...  # custom error
 
 
-def tune_GslitsCenter(md=None):
+def _with_uid(plan, run):
+    """plan: ``plan``, keeps the uid of its (last) run as ``run["uid"]``"""
+
+    def remember(name, doc):
+        run["uid"] = doc["uid"]
+
+    return (yield from bpp.subs_wrapper(plan, {"start": [remember]}))
+
+
+def _intensity():
+    """plan: count once (scaler0 preset time), returns upd2 counts/s"""
+    yield from bps.trigger(scaler0, wait=True)
+    counts = yield from bps.rd(UPD_SIGNAL.s)
+    return counts / scaler0.preset_time.get()
+
+
+def _still_tuned(names, intensity):
+    """
+    True if ``names`` were tuned recently and the intensity is still as
+    it was at the end of the last tune (see ``tune_history``)
+    """
+    return tune_history.is_fresh(GAP_HISTORY_KEY, intensity) and all(
+        tune_history.is_fresh(name) for name in names
+    )
+
+
+def _enough_counts(name, x):
+    """True if a fly scan has enough counts to analyze (else, say so)"""
+    if len(x) >= MINIMUM_POINTS:
+        return True
+    logger.warning(
+        "%s: fly scan gave %d counts (need %d), step scan instead",
+        name,
+        len(x),
+        MINIMUM_POINTS,
+    )
+    return False
+
+
+def _edge_in_range(y, min_change):
+    """True if the scan crossed the edge, with flat signal at both ends"""
+    change = abs(y[-1] - y[0])
+    return (
+        len(y) > 2
+        and change >= min_change
+        and abs(y[1] - y[0]) <= EDGE_FRACTION * change
+        and abs(y[-1] - y[-2]) <= EDGE_FRACTION * change
+    )
+
+
+def tune_GslitsCenter(md=None, force=False):
     """
     plan: optimize the guard slits' position
 
     tune to the peak centers
+
+    Unless ``force``, a motor is not tuned if its last tune is recent
+    and the intensity is still as it was at the end of the last guard
+    slit tune (see ``tune_history``), otherwise the range is narrowed to
+    the recent drift, first.
     """
     _md = dict()
     _md.update(md or {})
@@ -90,25 +160,69 @@ def tune_GslitsCenter(md=None):
         scaler0.select_channels([UPD_SIGNAL.chname.get()])
         CLOCK_SIGNAL.kind = Kind.config
 
-        tuner = TuneAxis(
-            [scaler0], motor, signal_name=UPD_SIGNAL.chname.get()
-        )
-        yield from tuner.tune(width=-width, num=steps + 1)
+        signal_name = UPD_SIGNAL.chname.get()
+        run = {}
+        fly = guard_slit.tune_mode == "fly"
+        if fly:
+            x_data, y_data = yield from _with_uid(
+                fly_scan(
+                    [scaler0],
+                    motor,
+                    x_n,
+                    x_0,
+                    signal_name,
+                    steps + 1,
+                    scaler0.preset_time.get(),
+                ),
+                run,
+            )
+            fly = _enough_counts(motor.name, x_data)
+            if not fly:
+                yield from bps.mv(motor, x_c)  # TuneAxis: the center
+        if not fly:
+            tuner = TuneAxis([scaler0], motor, signal_name=signal_name)
+            yield from _with_uid(
+                tuner.tune(width=-width, num=steps + 1), run
+            )
 
         bluesky_runengine_running = RE.state != "idle"
 
         if bluesky_runengine_running:
-            found = tuner.peak_detected()
-            center = tuner.peaks.com  # center of mass
-
             table = pyRestTable.Table()
             table.addLabel("tune parameter")
             table.addLabel("fitted value")
-            table.addRow(("peak detected?", found))
-            table.addRow(("center of mass", center))
-            table.addRow(("center from half max", tuner.peaks.cen))
-            table.addRow(("peak max (x,y)", tuner.peaks.max))
-            table.addRow(("FWHM", tuner.peaks.fwhm))
+            analysis = "center of mass"  # how the center was found
+            if fly:
+                y_max = max(y_data)
+                x_max = x_data[list(y_data).index(y_max)]
+                # as TuneAxis.peak_detected()
+                found = y_max > PEAK_FACTOR * min(y_data)
+                center, peak_width = peak_center(x_data, y_data)
+                sigma = peak_width / 2
+                table.addRow(("peak detected?", found))
+                table.addRow(("center of mass", center))
+                table.addRow(("peak max (x,y)", (x_max, y_max)))
+            else:
+                x_data, y_data = tuner.peaks.x_data, tuner.peaks.y_data
+                found = tuner.peak_detected()
+                center = tuner.peaks.com  # center of mass
+                sigma = tuner.peaks.fwhm / FWHM_PER_SIGMA
+                table.addRow(("peak detected?", found))
+                table.addRow(("center of mass", center))
+                table.addRow(("center from half max", tuner.peaks.cen))
+                table.addRow(("peak max (x,y)", tuner.peaks.max))
+                table.addRow(("FWHM", tuner.peaks.fwhm))
+            if guard_slit.tune_analysis == "fit":
+                fit = fit_peak(x_data, y_data)
+                table.addRow(("fit success?", fit.success))
+                table.addRow(("fitted center", fit.center))
+                table.addRow(("fitted center error", fit.center_error))
+                table.addRow(("fitted sigma", fit.width))
+                if fit.success:
+                    center, sigma = fit.center, fit.width
+                    analysis = "gaussian fit"
+                else:
+                    analysis = "center of mass, fit failed"
             logger.info(table)
 
             def cleanup_then_GuardSlitTuneError(msg):
@@ -139,24 +253,60 @@ def tune_GslitsCenter(md=None):
                 yield from cleanup_then_GuardSlitTuneError(
                     f"{motor.name}: Computed center too high: {center} > {x_n}"
                 )
-            if (
-                max(tuner.peaks.y_data)
-                <= guard_slit.tuning_intensity_threshold
-            ):
+            if max(y_data) <= guard_slit.tuning_intensity_threshold:
                 msg = f"{motor.name}: Peak intensity not strong enough to tune."
-                msg += f" {max(tuner.peaks.y_data)} < {guard_slit.tuning_intensity_threshold}"
+                msg += f" {max(y_data)} < {guard_slit.tuning_intensity_threshold}"
                 yield from cleanup_then_GuardSlitTuneError(msg)
 
-            logger.info(f"{motor.name}: move to {center} (center of mass)")
+            logger.info(f"{motor.name}: move to {center} ({analysis})")
             yield from bps.mv(motor, center)
+            intensity = yield from _intensity()
+            tune_history.add(
+                motor.name,
+                position=center,
+                offset=center - x_c,
+                width=sigma,
+                intensity=intensity,
+                uid=run.get("uid"),
+            )
+
+    def tune_motor(motor, width, steps):
+        """skip, or tune a narrower range, or tune the full range"""
+        if not force:
+            intensity = yield from _intensity()
+            if _still_tuned([motor.name], intensity):
+                logger.info(
+                    "%s: tuned recently, intensity %g/s, not tuning",
+                    motor.name,
+                    intensity,
+                )
+                return
+            x_c = motor.position
+            warm = tune_history.scan_range(
+                motor.name, x_c, x_c - width / 2, x_c + width / 2, steps
+            )
+            if warm is not None:
+                start, end, warm_steps = warm
+                logger.info(
+                    "%s: tune %g to %g (recent drift)", motor.name, start, end
+                )
+                try:
+                    yield from tune_guard_slit_motor(
+                        motor, abs(end - start), warm_steps
+                    )
+                    return
+                except GuardSlitTuneError as exc:
+                    logger.info("%s -- tune the full range", exc)
+                    yield from bps.mv(scaler0.preset_time, 0.2)
+        yield from tune_guard_slit_motor(motor, width, steps)
 
     # Here is the MAIN EVENT
     try:
-        yield from tune_guard_slit_motor(guard_slit.y, 2, 50)
+        yield from tune_motor(guard_slit.y, 2, 50)
     except GuardSlitTuneError as exc:
         logger.warning("Could not tune guard_slit.y -- %s", str(exc))
     try:
-        yield from tune_guard_slit_motor(guard_slit.x, 4, 20)
+        yield from tune_motor(guard_slit.x, 4, 20)
     except GuardSlitTuneError as exc:
         logger.warning("Could not tune guard_slit.y -- %s", str(exc))
 
@@ -165,11 +315,14 @@ def tune_GslitsCenter(md=None):
     # yield from bps.mv(ti_filter_shutter, "close")
 
 
-def _USAXS_tune_guardSlits(md=None):
+def _USAXS_tune_guardSlits(md=None, force=False):
     """
     plan: (internal) this performs the guard slit scan
 
     Called from tune_GslitsSize()
+
+    Unless ``force``, each blade scans a range narrowed to its recent
+    drift (see ``tune_history``) first.
     """
     _md = dict()
     _md.update(md or {})
@@ -236,25 +389,89 @@ def _USAXS_tune_guardSlits(md=None):
         "And now we can tune all of the guard slits, blade-by-blade"
     )
 
+    def scan_blade(axis, start, end, steps, ct_time):
+        """plan: scan the blade as guard_slit.tune_mode says, returns x, y"""
+        yield from bps.mv(axis, (start + end) / 2)  # TuneAxis: the center
+        scan_width = end - start
+        signal_name = UPD_SIGNAL.chname.get()
+        if guard_slit.tune_mode == "stream":
+            # stop counting once the edge is found
+            stats = EdgeStatistics(
+                axis.name,
+                signal_name,
+                min_change=guard_slit.tuning_intensity_threshold,
+                tolerance=guard_slit.tune_tolerance,
+            )
+            yield from edge_scan(
+                [scaler0], axis, start, end, steps + 1, stats
+            )
+            return stats.x_data, stats.y_data
+        elif guard_slit.tune_mode == "fly":
+            # count while the blade moves through the beam
+            x, y = yield from fly_scan(
+                [scaler0], axis, start, end, signal_name, steps + 1, ct_time
+            )
+            if _enough_counts(axis.name, x):
+                return x, y
+            yield from bps.mv(axis, (start + end) / 2)
+        elif guard_slit.tune_mode == "adaptive":
+            # coarse scan, then dense points only at the edge
+            return (
+                yield from adaptive_edge_scan(
+                    [scaler0],
+                    axis,
+                    start,
+                    end,
+                    steps + 1,
+                    signal_name,
+                    min_change=guard_slit.tuning_intensity_threshold,
+                )
+            )
+        tuner = TuneAxis([scaler0], axis, signal_name=signal_name)
+        yield from tuner.tune(width=scan_width, num=steps + 1)
+        return tuner.peaks.x_data, tuner.peaks.y_data
+
     def tune_blade_edge(axis, start, end, steps, ct_time, results):
         logger.info(f"{axis.name}: scan from {start} to {end}")
         old_ct_time = scaler0.preset_time.get()
         old_position = axis.position
 
-        yield from bps.mv(  # move to center of scan range for tune
-            scaler0.preset_time, ct_time, axis, (start + end) / 2,
-        )
-        scan_width = end - start
+        yield from bps.mv(scaler0.preset_time, ct_time)
 
         scaler0.select_channels([UPD_SIGNAL.chname.get()])
         scaler0.channels.chan01.kind = Kind.config
 
-        tuner = TuneAxis(
-            [scaler0], axis, signal_name=UPD_SIGNAL.chname.get()
-        )
-        yield from tuner.tune(width=scan_width, num=steps + 1)
+        # the last tune redefined the edge of each blade as 0
+        run = {}
+        warm = None
+        if not force:
+            warm = tune_history.scan_range(axis.name, 0, start, end, steps)
+        if warm is not None:
+            logger.info(
+                "%s: scan from %g to %g (recent drift)",
+                axis.name,
+                warm[0],
+                warm[1],
+            )
+            x_data, y_data = yield from _with_uid(
+                scan_blade(axis, *warm, ct_time), run
+            )
+            if not _edge_in_range(
+                y_data, guard_slit.tuning_intensity_threshold
+            ):
+                logger.info("%s: edge not found, scan all", axis.name)
+                warm = None
+        if warm is None:
+            x_data, y_data = yield from _with_uid(
+                scan_blade(axis, start, end, steps, ct_time), run
+            )
+
+        if len(x_data) < MINIMUM_POINTS:
+            msg = f"{axis.name}: {len(x_data)} points, need {MINIMUM_POINTS}."
+            msg += "  Not tuning this axis."
+            yield from cleanup(msg)
 
-        diff = abs(tuner.peaks.y_data[0] - tuner.peaks.y_data[-1])
+        diff = abs(y_data[0] - y_data[-1])
         if diff < guard_slit.tuning_intensity_threshold:
             msg = f"{axis.name}: Not enough intensity change from first to last point."
             msg += f" {diff} < {guard_slit.tuning_intensity_threshold}."
@@ -262,8 +479,27 @@ def _USAXS_tune_guardSlits(md=None):
             msg += "  Not tuning this axis."
             yield from cleanup(msg)
 
-        x, y = numerical_derivative(tuner.peaks.x_data, tuner.peaks.y_data)
-        position, width = peak_center(x, y)
+        position = None
+        if guard_slit.tune_analysis == "fit":
+            fit = fit_edge(x_data, y_data)
+            if fit.success:
+                # 2 * standard deviation, as peak_center()
+                position, width = fit.center, 2 * fit.width
+                sigma = fit.width
+                logger.info(
+                    "%s: edge fit %g +/- %g, width %g +/- %g",
+                    axis.name,
+                    position,
+                    fit.center_error,
+                    width,
+                    2 * fit.width_error,
+                )
+            else:
+                logger.info("%s: edge fit failed, using moments", axis.name)
+        if position is None:
+            x, y = numerical_derivative(x_data, y_data)
+            position, width = peak_center(x, y)
+            sigma = width / 2
         width *= guard_slit.scale_factor  # expand a bit
 
         # Check if movement was from unblocked to blocked
@@ -292,6 +528,14 @@ def _USAXS_tune_guardSlits(md=None):
 
         results["width"] = width
         results["position"] = position
+        tune_history.add(
+            axis.name,
+            position=position,
+            offset=position,  # expected at 0
+            width=sigma,
+            intensity=max(y_data) / ct_time,
+            uid=run.get("uid"),
+        )
 
     tunes = defaultdict(dict)
     logger.info("*** 1. tune top guard slits")
@@ -399,15 +643,29 @@ def _USAXS_tune_guardSlits(md=None):
     yield from guard_slit.status_update()
 
 
-def tune_GslitsSize(md=None):
+def tune_GslitsSize(md=None, force=False):
     """
     plan: optimize the guard slits' gap
 
     tune to the slit edges (peak of the derivative of diode vs. position)
+
+    Unless ``force``, the slits are not tuned if all blades were tuned
+    recently and the intensity is still as it was after that tune (see
+    ``tune_history``).
     """
     _md = dict()
     _md.update(md or {})
 
+    blades = [guard_slit.top, guard_slit.bot, guard_slit.outb, guard_slit.inb]
+    if not force:
+        intensity = yield from _intensity()
+        if _still_tuned([blade.name for blade in blades], intensity):
+            logger.info(
+                "Guard slits tuned recently, intensity %g/s, not tuning",
+                intensity,
+            )
+            return
+
     # yield from IfRequestedStopBeforeNextScan()
     # yield from mode_USAXS()
     # yield from bps.mv(
@@ -424,7 +682,7 @@ def tune_GslitsSize(md=None):
     # yield from insertTransmissionFilters()
     # yield from autoscale_amplifiers([upd_controls, I0_controls, I00_controls])
     try:
-        yield from _USAXS_tune_guardSlits()
+        yield from _USAXS_tune_guardSlits(force=force)
         yield from bps.mv(
             # ti_filter_shutter, "close",
             guard_h_size,
@@ -436,15 +694,21 @@ def tune_GslitsSize(md=None):
         logger.info(
             f"Guard slit now: V={guard_slit.v_size.get()} and H={guard_slit.h_size.get()}"
         )
+        if all(tune_history.is_fresh(blade.name) for blade in blades):
+            # intensity through the tuned gap, to compare next time
+            intensity = yield from _intensity()
+            tune_history.add(GAP_HISTORY_KEY, intensity=intensity)
     except GuardSlitTuneError as exc:
         logger.warning("Could not tune guard slits' gap: %s", str(exc))
 
 
-def tune_Gslits(md=None):
+def tune_Gslits(md=None, force=False):
     """
     plan: scan and find optimal guard slit positions
+
+    ``force``: tune, even if the last tunes are recent (and good)
     """
     _md = dict()
     _md.update(md or {})
-    yield from tune_GslitsCenter(md=_md)
-    yield from tune_GslitsSize(md=_md)
+    yield from tune_GslitsCenter(md=_md, force=force)
+    yield from tune_GslitsSize(md=_md, force=force)
@@ -0,0 +1,234 @@
+"""
+history of tune results: narrow the next tune, or skip it
+
+Each tune result (of a guard slit blade or motor) is appended to a
+file, one JSON object per line::
+
+    {"blade": "guard_slit_top", "position": -0.0042, "offset": -0.0042,
+     "width": 0.021, "intensity": 412000.0, "time": 1634567890.1,
+     "uid": "..."}
+
+``offset`` is the position found minus the position the tune expected
+(where the last tune left it), ``width`` is the standard deviation of
+the edge or peak, ``intensity`` is in counts per second.
+
+The tunes use the history to:
+
+* scan a narrower range (:meth:`TuneHistory.scan_range`): around the
+  expected position, as far as the recent offsets (drift) and the
+  width, with the same spacing of points (fewer points),
+* skip a tune (:meth:`TuneHistory.is_fresh`): if the last result is
+  recent and the intensity now is still close to what it was then.
+
+EXAMPLE::
+
+    tune_history.latest("guard_slit_top")
+    print(tune_history.summary())
+"""
+
+__all__ = """
+    TuneHistory
+    tune_history
+""".split()
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+import json
+import math
+import os
+import pyRestTable
+import threading
+import time
+
+from .derivative import MINIMUM_POINTS
+
+HISTORY_FILE = os.path.join(
+    os.path.expanduser("~"), ".config", "usaxs_tune_history.jsonl"
+)
+MAX_RECORDS = 100  # kept for each blade
+FRESH_AGE = 3600  # seconds, a tune this recent need not be repeated
+DRIFT_AGE = 7 * 24 * 3600  # seconds, the offsets of this period are drift
+DRIFT_RECORDS = 10  # most (recent) offsets used for the drift
+DRIFT_MARGIN = 2  # scan this many times the largest drift ...
+WIDTHS = 4  # ... plus this many widths, on each side of the expected
+INTENSITY_FRACTION = 0.9  # skip a tune if the intensity is still this
+
+
+class TuneHistory:
+    """
+    tune results, kept in ``filename`` (JSON lines)
+
+    PARAMETERS
+
+    filename : str
+        the history file (created when the first result is added)
+    """
+
+    def __init__(self, filename=HISTORY_FILE):
+        self.filename = filename
+        self._records = None  # {blade: [record]}, read when needed
+        self._lock = threading.RLock()
+
+    def _load(self):
+        """read the file (once), compact it if it has grown too long"""
+        with self._lock:
+            if self._records is not None:
+                return self._records
+            self._records = {}
+            lines = 0
+            if os.path.exists(self.filename):
+                with open(self.filename) as f:
+                    for lines, line in enumerate(f, start=1):
+                        try:
+                            record = json.loads(line)
+                            blade = record["blade"]
+                        except (ValueError, KeyError, TypeError):
+                            logger.warning(
+                                "%s line %d: not a tune result",
+                                self.filename,
+                                lines,
+                            )
+                            continue
+                        self._records.setdefault(blade, []).append(record)
+            kept = 0
+            for blade, records in self._records.items():
+                del records[:-MAX_RECORDS]
+                kept += len(records)
+            if lines > 2 * max(kept, MAX_RECORDS):
+                self._rewrite()
+            return self._records
+
+    def _rewrite(self):
+        """write the kept records (replaces the file)"""
+        records = sorted(
+            (r for v in self._records.values() for r in v),
+            key=lambda r: r.get("time", 0),
+        )
+        temporary = self.filename + ".tmp"
+        with open(temporary, "w") as f:
+            f.writelines(json.dumps(r) + "\n" for r in records)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.filename)
+
+    def add(
+        self,
+        blade,
+        position=None,
+        offset=None,
+        width=None,
+        intensity=None,
+        uid=None,
+    ):
+        """add (and save) a tune result, returns it"""
+        record = dict(
+            blade=blade,
+            position=position,
+            offset=offset,
+            width=width,
+            intensity=intensity,
+            time=time.time(),
+            uid=uid,
+        )
+        # numpy numbers, as plain numbers
+        record = {
+            k: (v if v is None or isinstance(v, str) else float(v))
+            for k, v in record.items()
+        }
+        with self._lock:
+            records = self._load().setdefault(blade, [])
+            records.append(record)
+            del records[:-MAX_RECORDS]
+            os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+            with open(self.filename, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        return record
+
+    def records(self, blade, max_age=None):
+        """results of ``blade`` (no older than ``max_age`` seconds)"""
+        with self._lock:
+            records = list(self._load().get(blade, []))
+        if max_age is not None:
+            oldest = time.time() - max_age
+            records = [r for r in records if r["time"] >= oldest]
+        return records
+
+    def latest(self, blade):
+        """last result of ``blade`` (or None)"""
+        records = self.records(blade)
+        return records[-1] if len(records) > 0 else None
+
+    def is_fresh(self, blade, intensity=None, max_age=FRESH_AGE):
+        """
+        True if the last result of ``blade`` is good enough to skip a tune
+
+        It is no older than ``max_age`` seconds and, if ``intensity``
+        (counts per second) is given, that is at least
+        ``INTENSITY_FRACTION`` of the intensity of the last result.
+        """
+        last = self.latest(blade)
+        if last is None or time.time() - last["time"] > max_age:
+            return False
+        if intensity is None:
+            return True
+        if last["intensity"] is None:
+            return False
+        return intensity >= INTENSITY_FRACTION * last["intensity"]
+
+    def scan_range(self, blade, expected, start, end, steps):
+        """
+        narrower tune range ``(start, end, steps)``, or None
+
+        The range is centered at ``expected``, out to ``DRIFT_MARGIN``
+        times the largest recent offset plus ``WIDTHS`` times the last
+        width (within ``start`` & ``end``).  ``steps`` is reduced to
+        keep the spacing of the points (at least ``MINIMUM_POINTS``).
+        None if there are no recent results or the range is not
+        narrower.
+        """
+        recent = [
+            r
+            for r in self.records(blade, max_age=DRIFT_AGE)
+            if r["offset"] is not None and r["width"] is not None
+        ][-DRIFT_RECORDS:]
+        if len(recent) == 0:
+            return None
+        drift = max(abs(r["offset"]) for r in recent)
+        half = DRIFT_MARGIN * drift + WIDTHS * abs(recent[-1]["width"])
+        low, high = sorted((start, end))
+        new_low = max(low, expected - half)
+        new_high = min(high, expected + half)
+        if new_high <= new_low or new_high - new_low >= high - low:
+            return None
+        fraction = (new_high - new_low) / (high - low)
+        new_steps = max(int(math.ceil(steps * fraction)), MINIMUM_POINTS)
+        if new_steps >= steps:
+            return None
+        if start > end:
+            new_low, new_high = new_high, new_low  # same direction
+        return new_low, new_high, new_steps
+
+    def summary(self):
+        """table of the last result of each blade"""
+        table = pyRestTable.Table()
+        table.labels = "blade position width intensity age(s) uid".split()
+        with self._lock:
+            blades = sorted(self._load())
+        for blade in blades:
+            r = self.latest(blade)
+            table.addRow(
+                (
+                    blade,
+                    r["position"],
+                    r["width"],
+                    r["intensity"],
+                    round(time.time() - r["time"]),
+                    (r["uid"] or "")[:8],
+                )
+            )
+        return table
+
+
+tune_history = TuneHistory()
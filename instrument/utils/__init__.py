@@ -4,3 +4,6 @@ any extra commands or utility functions here
 
 # from .check_limits import *
 # from .hkl_user import *
+from .lazy_devices import *
+from .pv_cache import *
+from .ioc_state import *
@@ -0,0 +1,126 @@
+"""
+desired IOC state: declare PV values, write only the ones that differ
+
+Device setup code declares the values it wants (instead of writing them
+one at a time).  The reconciler compares each with the current value
+(from the monitor, no extra channel access traffic), logs any drift, and
+writes only the values that differ, all at once, then waits for all the
+writes to complete.  Values that must be written after others (such as
+the scan rate of a calc record, after its calculation) are declared
+with a higher ``order``: each order is written after the writes of the
+orders before it have completed.
+
+EXAMPLE::
+
+    declare_ioc_value(m1.steps_per_rev, 8000)
+    reconcile_ioc_state()
+"""
+
+__all__ = """
+    declare_ioc_value
+    reconcile_ioc_state
+""".split()
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+import math
+import threading
+import time
+
+_desired = {}  # pvname: (signal, value, order)
+_pending = []  # pvnames declared but not yet reconciled
+_lock = threading.RLock()
+
+
+def declare_ioc_value(signal, value, order=0):
+    """
+    declare that EPICS ``signal`` should have ``value``
+
+    ``value`` is written after the values of lower ``order``.
+    """
+    pvname = getattr(signal, "setpoint_pvname", signal.pvname)
+    with _lock:
+        _desired[pvname] = (signal, value, order)
+        if pvname not in _pending:
+            _pending.append(pvname)
+
+
+def _current_value(signal, desired):
+    if isinstance(desired, str):
+        return signal.get(as_string=True)
+    return signal.get()
+
+
+def _differs(current, desired):
+    if isinstance(desired, str) or isinstance(current, str):
+        return str(current).strip() != str(desired).strip()
+    try:
+        return not math.isclose(current, desired, rel_tol=1e-9, abs_tol=0)
+    except TypeError:
+        return current != desired
+
+
+def reconcile_ioc_state(everything=False, timeout=10):
+    """
+    write the declared values that differ from the IOC, all at once
+
+    PARAMETERS
+
+    everything : bool
+        check all values ever declared (default: only the new declarations)
+    timeout : float
+        time (seconds) to wait for all the writes to complete
+
+    Returns the list of the PVs that were written.
+    """
+    with _lock:
+        names = list(_desired) if everything else list(_pending)
+        _pending.clear()
+
+    drifted = []
+    for pvname in names:
+        signal, desired, order = _desired[pvname]
+        try:
+            current = _current_value(signal, desired)
+        except Exception as exc:
+            logger.warning("cannot read %s: %s", pvname, exc)
+            continue
+        if _differs(current, desired):
+            logger.info(
+                "IOC drift: %s = %r, want %r", pvname, current, desired
+            )
+            drifted.append((order, pvname, signal, desired))
+
+    written = []
+    deadline = time.time() + timeout
+    for order in sorted(set(item[0] for item in drifted)):
+        done = threading.Semaphore(0)  # completed writes of this order
+
+        def put_complete(*args, done=done, **kwargs):
+            done.release()
+
+        writing = []
+        for _order, pvname, signal, desired in drifted:
+            if _order != order:
+                continue
+            try:
+                signal.put(desired, use_complete=True, callback=put_complete)
+                writing.append(pvname)
+            except Exception as exc:
+                logger.error("cannot write %s: %s", pvname, exc)
+        written += writing
+
+        for pvname in writing:
+            if not done.acquire(timeout=max(0, deadline - time.time())):
+                logger.warning(
+                    "not all IOC writes completed within %s s: %s",
+                    timeout,
+                    ", ".join(writing),
+                )
+                break
+    logger.debug(
+        "IOC state: %d checked, %d written", len(names), len(written)
+    )
+    return written
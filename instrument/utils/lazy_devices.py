@@ -0,0 +1,392 @@
+"""
+lazy, on-demand construction of ophyd devices
+
+A device module registers a *factory* (and, optionally, *setup* code that
+runs once the device is connected) instead of building the device at
+import time.  The name it exports is a proxy that builds, connects, and
+sets up the real device the first time any attribute is used.
+
+EXAMPLE::
+
+    def _make_m1():
+        return EpicsMotor("sky:m1", name="m1")
+
+    m1 = lazy_device("m1", _make_m1)
+
+    # nothing connects until the motor is used
+    m1.position
+
+Comparing proxies, using them as dict keys or in sets, and
+``isinstance()`` do not build the device: a proxy is equal only to
+itself and is an instance of :class:`LazyDevice`, not of the device's
+class.
+
+To connect all (or many) devices at once, call :func:`connect_devices`.
+All of their channel access connections start together and are awaited
+against a single deadline, so it takes about as long as the slowest IOC.
+"""
+
+__all__ = """
+    connect_devices
+    device_report
+    lazy_component
+    lazy_device
+    when_built
+""".split()
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+import operator
+import threading
+import time
+
+import pyRestTable
+
+from ..iocs.health import ioc_is_up
+from ..iocs.health import ioc_status
+from .ioc_state import reconcile_ioc_state
+from .pv_cache import pv_metadata_cache
+
+
+_registry = {}  # registered proxies, in order of registration
+
+
+class LazyDevice:
+    """
+    stand-in for an ophyd object, built (and connected) on first use
+
+    PARAMETERS
+
+    name : str
+        name of the object (reported by :func:`device_report`)
+    factory : callable
+        ``factory()`` returns the (unconnected) ophyd object
+    setup : callable
+        (optional) ``setup(obj)`` is called once ``obj`` is connected
+    ioc : str
+        (optional) PV prefix of the IOC: if it is known to be down,
+        fail at once rather than wait for the connection timeout
+    """
+
+    __slots__ = (
+        "_lazy_name",
+        "_lazy_factory",
+        "_lazy_ioc",
+        "_lazy_setups",
+        "_lazy_target",
+        "_lazy_lock",
+        "_lazy_stats",
+    )
+
+    def __init__(self, name, factory, setup=None, ioc=None):
+        object.__setattr__(self, "_lazy_name", name)
+        object.__setattr__(self, "_lazy_factory", factory)
+        object.__setattr__(self, "_lazy_ioc", ioc)
+        object.__setattr__(self, "_lazy_setups", [])
+        object.__setattr__(self, "_lazy_target", None)
+        object.__setattr__(self, "_lazy_lock", threading.RLock())
+        object.__setattr__(
+            self,
+            "_lazy_stats",
+            dict(built=False, error=None, build_time=None, when=None),
+        )
+        if setup is not None:
+            self._lazy_setups.append(setup)
+
+    # -- construction stages --------------------------------------------
+
+    @property
+    def _lazy_constructed(self):
+        return self._lazy_target is not None
+
+    def _lazy_construct(self):
+        """create the ophyd object (starts, but does not wait for, CA)"""
+        with self._lazy_lock:
+            if self._lazy_target is None:
+                t0 = time.time()
+                obj = self._lazy_factory()
+                if self._lazy_ioc is not None:
+                    try:
+                        pv_metadata_cache.apply(obj, self._lazy_ioc)
+                    except Exception as exc:
+                        logger.warning(
+                            "PV metadata cache, '%s': %s", self._lazy_name, exc
+                        )
+                object.__setattr__(self, "_lazy_target", obj)
+                self._lazy_stats["when"] = t0
+                self._lazy_stats["build_time"] = time.time() - t0
+            return self._lazy_target
+
+    def _lazy_connect(self, timeout=None):
+        """wait for the ophyd object to connect"""
+        obj = self._lazy_construct()
+        if hasattr(obj, "wait_for_connection"):
+            kwargs = {} if timeout is None else dict(timeout=timeout)
+            obj.wait_for_connection(**kwargs)
+        return obj
+
+    def _lazy_configure(self, reconcile=True):
+        """
+        run the setup code (once) after the object is connected
+
+        Setup code declares the IOC values it wants, these are written
+        (only if different) by :func:`reconcile_ioc_state`.
+        """
+        with self._lazy_lock:
+            obj = self._lazy_target
+            while len(self._lazy_setups) > 0:
+                setup = self._lazy_setups.pop(0)
+                setup(obj)
+            if reconcile:
+                reconcile_ioc_state()
+            self._lazy_stats["built"] = True
+            return obj
+
+    def _lazy_resolve(self):
+        """return the real ophyd object, building it if necessary"""
+        if self._lazy_stats["built"]:
+            return self._lazy_target
+        with self._lazy_lock:
+            if not self._lazy_stats["built"]:
+                t0 = time.time()
+                try:
+                    if self._lazy_ioc is not None and not ioc_is_up(
+                        self._lazy_ioc
+                    ):
+                        raise TimeoutError(
+                            f"IOC {self._lazy_ioc} is not running"
+                        )
+                    self._lazy_connect()
+                    self._lazy_configure()
+                except Exception as exc:
+                    self._lazy_stats["error"] = f"{exc.__class__.__name__}"
+                    logger.error(
+                        "could not build '%s': %s", self._lazy_name, exc
+                    )
+                    raise
+                self._lazy_stats["error"] = None
+                self._lazy_stats["build_time"] = time.time() - t0
+                logger.debug(
+                    "built '%s' in %.3f s",
+                    self._lazy_name,
+                    self._lazy_stats["build_time"],
+                )
+        return self._lazy_target
+
+    # -- transparent proxy ----------------------------------------------
+    # Comparing or hashing a proxy (dict keys, sets) and isinstance()
+    # do not build it: it compares by identity, and it is a LazyDevice
+    # (not an instance of the device's class).
+
+    def __getattr__(self, attr):
+        return getattr(self._lazy_resolve(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._lazy_resolve(), attr, value)
+
+    def __delattr__(self, attr):
+        delattr(self._lazy_resolve(), attr)
+
+    def __dir__(self):
+        return dir(self._lazy_resolve())
+
+    def __repr__(self):
+        return repr(self._lazy_resolve())
+
+    def __str__(self):
+        return str(self._lazy_resolve())
+
+    def __eq__(self, other):
+        return self is other
+
+    def __hash__(self):
+        return object.__hash__(self)
+
+
+def lazy_device(name, factory, setup=None, ioc=None):
+    """
+    register ``factory`` (and optional ``setup``), return a lazy proxy
+
+    The proxy is listed by :func:`device_report`.
+    """
+    if name in _registry:
+        logger.warning("replacing lazy device '%s'", name)
+    proxy = LazyDevice(name, factory, setup=setup, ioc=ioc)
+    _registry[name] = proxy
+    return proxy
+
+
+def lazy_component(parent, attr, name=None):
+    """
+    lazy proxy for ``parent.<attr>`` (dotted attr: ``channels.chan01.s``)
+
+    Using the proxy builds the parent.  Not listed by :func:`device_report`.
+    """
+    getter = operator.attrgetter(attr)
+
+    def factory():
+        if isinstance(parent, LazyDevice):
+            return getter(parent._lazy_resolve())
+        return getter(parent)
+
+    return LazyDevice(name or attr, factory)
+
+
+def when_built(proxy, setup):
+    """
+    call ``setup(obj)`` once the proxy's device is built
+
+    If it is already built, call it now.
+    """
+    with proxy._lazy_lock:
+        proxy._lazy_setups.append(setup)
+        if proxy._lazy_stats["built"]:
+            proxy._lazy_configure()
+
+
+def _epics_signals(obj):
+    """list the EPICS signals (those with a ``pvname``) of ``obj``"""
+    if hasattr(obj, "walk_signals"):
+        signals = [item.item for item in obj.walk_signals()]
+    else:
+        signals = [obj]
+    return [sig for sig in signals if hasattr(sig, "pvname")]
+
+
+def _ioc_prefix(pvname):
+    return pvname.split(":")[0] + ":"
+
+
+def connect_devices(names=None, timeout=10, slow=1, show=True):
+    """
+    build & connect registered devices concurrently, with one deadline
+
+    All devices are constructed first (which starts every CA connection),
+    then the PVs are awaited together until ``timeout`` seconds have passed.
+    Devices with all PVs connected are set up.  The others are left to
+    connect on first use.  Devices of IOCs that are down are skipped.
+
+    PARAMETERS
+
+    names : [str]
+        (optional) names of the devices to connect (default: all)
+    timeout : float
+        global deadline (seconds) for all connections
+    slow : float
+        PVs connecting later than this (seconds) are reported as slow
+    show : bool
+        print the summary tables (default: True)
+
+    Returns two tables: the number of connected, slow, and missing PVs
+    of each IOC (by prefix), and the slow and missing PVs.
+    """
+    t0 = time.time()
+    deadline = t0 + timeout
+    proxies = [
+        proxy
+        for name, proxy in _registry.items()
+        if (names is None or name in names) and not proxy._lazy_stats["built"]
+    ]
+
+    iocs = set(p._lazy_ioc for p in proxies if p._lazy_ioc is not None)
+    up = ioc_status(iocs)  # probe all IOCs at once
+    for prefix in sorted(iocs):
+        if not up[prefix]:
+            logger.warning("IOC %s is down, skipping its devices", prefix)
+
+    pending = {}  # signal: proxy
+    for proxy in proxies:
+        if proxy._lazy_ioc is not None and not up[proxy._lazy_ioc]:
+            proxy._lazy_stats["error"] = "IOC down"
+            continue
+        try:
+            obj = proxy._lazy_construct()
+        except Exception as exc:
+            proxy._lazy_stats["error"] = f"{exc.__class__.__name__}"
+            logger.error("could not build '%s': %s", proxy._lazy_name, exc)
+            continue
+        for sig in _epics_signals(obj):
+            pending[sig] = proxy
+
+    connected = {}  # pvname: (seconds to connect, proxy)
+    missing = {}  # pvname: proxy
+    while len(pending) > 0:
+        for sig in [sig for sig in pending if sig.connected]:
+            connected[sig.pvname] = (time.time() - t0, pending.pop(sig))
+        if time.time() >= deadline:
+            break
+        time.sleep(0.01)
+    for sig, proxy in pending.items():
+        missing[sig.pvname] = proxy
+
+    incomplete = set(missing.values())
+    for proxy in proxies:
+        if proxy in incomplete:
+            proxy._lazy_stats["error"] = "missing PVs"
+            continue
+        if not proxy._lazy_constructed:
+            continue
+        try:
+            proxy._lazy_configure(reconcile=False)
+            proxy._lazy_stats["error"] = None
+        except Exception as exc:
+            proxy._lazy_stats["error"] = f"{exc.__class__.__name__}"
+            logger.error("could not set up '%s': %s", proxy._lazy_name, exc)
+    reconcile_ioc_state()  # all the devices together
+    logger.info(
+        "connected %d PVs in %.3f s, %d missing",
+        len(connected),
+        time.time() - t0,
+        len(missing),
+    )
+
+    summary = {}
+    for pvname, (dt, proxy) in connected.items():
+        counts = summary.setdefault(_ioc_prefix(pvname), [0, 0, 0])
+        counts[0] += 1
+        if dt > slow:
+            counts[1] += 1
+    for pvname in missing:
+        summary.setdefault(_ioc_prefix(pvname), [0, 0, 0])[2] += 1
+
+    ioc_table = pyRestTable.Table()
+    ioc_table.labels = "IOC connected slow missing".split()
+    for prefix, counts in sorted(summary.items()):
+        ioc_table.addRow([prefix] + counts)
+
+    pv_table = pyRestTable.Table()
+    pv_table.labels = "PV status connect_time_s device".split()
+    for pvname, (dt, proxy) in sorted(connected.items()):
+        if dt > slow:
+            pv_table.addRow((pvname, "slow", f"{dt:.3f}", proxy._lazy_name))
+    for pvname, proxy in sorted(missing.items()):
+        pv_table.addRow((pvname, "missing", "", proxy._lazy_name))
+    if show:
+        print(ioc_table)
+        if len(pv_table.rows) > 0:
+            print(pv_table)
+    return ioc_table, pv_table
+
+
+def device_report(show=True):
+    """
+    table of the lazy devices: which were built, and how long it took
+    """
+    table = pyRestTable.Table()
+    table.labels = "name built build_time_s when error".split()
+    for name, proxy in _registry.items():
+        stats = proxy._lazy_stats
+        when = stats["when"]
+        if when is not None:
+            when = time.strftime("%H:%M:%S", time.localtime(when))
+        build_time = stats["build_time"]
+        if build_time is not None:
+            build_time = f"{build_time:.3f}"
+        table.addRow(
+            (name, stats["built"], build_time, when, stats["error"] or "")
+        )
+    if show:
+        print(table)
+    return table
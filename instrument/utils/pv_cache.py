@@ -0,0 +1,241 @@
+"""
+persistent cache of PV control metadata, to speed up reconnection
+
+Before its devices are usable, ophyd waits (for every PV) for its control
+information: enum strings, limits, precision, and units.  This cache keeps
+that metadata on disk, keyed by PV name and by the boot time of the IOC
+(from its iocStats ``STARTTOD`` PV, such as ``iocsky.start_time``).
+
+When a lazy device is constructed, its signals with cached metadata
+start from it and are marked as having their first metadata, so they
+are usable as soon as their channels connect (ophyd does not wait to
+read the control information).  Once connected, each of these signals
+reads its control information in the background: any change replaces
+the cached value (logged, and sent to the signal's metadata
+subscribers).  The boot time of the IOC is also read in the background
+(the first time one of its devices is built): if the IOC has been
+restarted, the cached entries not yet read again are discarded.
+
+Only IOCs with a ``boot_time`` PV (in ``IOCS``, see
+:mod:`instrument.iocs.health`) are cached: ``sky:``.
+"""
+
+__all__ = [
+    "pv_metadata_cache",
+]
+
+from ..session_logs import logger
+
+logger.info(__file__)
+
+import atexit
+import json
+import os
+import threading
+
+from ..iocs.health import IOCS
+from ..iocs.health import ioc_boot_times
+
+CACHE_FILE = os.path.join(
+    os.path.expanduser("~"), ".cache", "instrument", "pv_metadata.json"
+)
+CACHED_KEYS = """
+    enum_strs lower_ctrl_limit precision units upper_ctrl_limit
+""".split()
+
+
+class PVMetadataCache:
+    """
+    on-disk cache of PV control metadata, per IOC boot
+
+    PARAMETERS
+
+    filename : str
+        (optional) name of the cache file (JSON)
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename or CACHE_FILE
+        self._lock = threading.RLock()
+        self._iocs = None  # prefix: dict(boot=str, pvs={pvname: metadata})
+        self._validated = set()  # prefixes checked against IOC boot time
+        self._fresh = set()  # PVs read from the IOC in this session
+        self._dirty = False
+
+    def load(self):
+        """read the cache file (once)"""
+        with self._lock:
+            if self._iocs is None:
+                self._iocs = {}
+                try:
+                    with open(self.filename) as f:
+                        self._iocs = json.load(f)
+                except (OSError, ValueError):
+                    pass
+            return self._iocs
+
+    def save(self):
+        """write the cache file, if changed"""
+        with self._lock:
+            if not self._dirty:
+                return
+            text = json.dumps(self._iocs)
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            with open(self.filename + ".tmp", "w") as f:
+                f.write(text)
+            os.replace(self.filename + ".tmp", self.filename)
+        except OSError as exc:
+            logger.warning("cannot write %s: %s", self.filename, exc)
+
+    def _entries(self, prefix):
+        """cached PVs of IOC ``prefix`` (None if IOC has no boot time)"""
+        if IOCS.get(prefix, {}).get("boot_time") is None:
+            return None
+        with self._lock:
+            iocs = self.load()
+            if prefix not in iocs:
+                iocs[prefix] = dict(boot=None, pvs={})
+            if prefix not in self._validated:
+                self._validated.add(prefix)
+                threading.Thread(
+                    target=self._validate,
+                    args=(prefix,),
+                    name=f"PV cache {prefix}",
+                    daemon=True,
+                ).start()
+            return iocs[prefix]["pvs"]
+
+    def _validate(self, prefix):
+        """discard the entries of IOC ``prefix`` if it was restarted"""
+        try:
+            boot = ioc_boot_times([prefix]).get(prefix)
+        except Exception as exc:
+            logger.warning("boot time of IOC %s: %s", prefix, exc)
+            return
+        if boot is None:
+            return  # IOC down: cannot tell, the background reads decide
+        with self._lock:
+            ioc = self._iocs[prefix]
+            if ioc["boot"] == boot:
+                return
+            if ioc["boot"] is not None:
+                logger.info(
+                    "IOC %s restarted, discard its PV metadata", prefix
+                )
+            ioc["boot"] = boot
+            pvs = ioc["pvs"]  # same dict as the updaters use
+            for pvname in list(pvs):
+                if pvname not in self._fresh:
+                    del pvs[pvname]
+            self._dirty = True
+
+    def apply(self, obj, prefix):
+        """
+        seed the EPICS signals of ``obj`` (from IOC ``prefix``) from cache
+
+        Also watch their metadata, to keep the cache current.
+        """
+        entries = self._entries(prefix)
+        if entries is None:
+            return
+        if hasattr(obj, "walk_signals"):
+            signals = [item.item for item in obj.walk_signals()]
+        else:
+            signals = [obj]
+        hits = 0
+        for sig in signals:
+            if not hasattr(sig, "pvname"):
+                continue
+            with self._lock:
+                cached = entries.get(sig.pvname)
+            seeded = cached is not None and self._seedable(sig)
+            # subscribe first: seeding may find the channel connected
+            sig.subscribe(
+                self._updater(entries, sig, seeded),
+                event_type=sig.SUB_META,
+                run=False,
+            )
+            if seeded:
+                self._seed(sig, cached)
+                hits += 1
+        logger.debug(
+            "%s: %d of %d signals from PV metadata cache",
+            getattr(obj, "name", obj),
+            hits,
+            len(signals),
+        )
+
+    def _seedable(self, sig):
+        """False if ``sig`` is not from the ophyd version we know"""
+        return all(
+            hasattr(sig, attr)
+            for attr in """
+                _metadata _metadata_changed _received_first_metadata
+                _run_metadata_callbacks _set_event_if_ready
+            """.split()
+        )
+
+    def _seed(self, sig, cached):
+        """use cached metadata, do not wait for it from the IOC"""
+        sig._metadata.update(cached)
+        for pvname in sig._received_first_metadata:
+            sig._received_first_metadata[pvname] = True
+        sig._set_event_if_ready()  # in case the channel connected already
+
+    def _refresh(self, sig):
+        """read the control information of seeded ``sig`` in background"""
+        pvs = {
+            pv.pvname: pv
+            for pv in (
+                getattr(sig, "_read_pv", None),
+                getattr(sig, "_write_pv", None),
+            )
+            if pv is not None
+        }
+
+        def received(pvname, md):
+            sig._metadata_changed(
+                pvname,
+                md,
+                require_timestamp=True,
+                update=True,
+                from_monitor=False,
+            )
+            sig._run_metadata_callbacks()  # the updater sees the IOC values
+
+        for pv in pvs.values():
+            pv.get_all_metadata_callback(received, timeout=10)
+
+    def _updater(self, entries, sig, seeded):
+        """make a SUB_META callback that updates the cached entry"""
+        pvname = sig.pvname
+        refresh = [seeded]  # seeded signal: read from IOC once connected
+
+        def update(*args, **kwargs):
+            if not kwargs.get("connected", True):
+                return
+            if refresh[0]:
+                refresh[0] = False
+                self._refresh(sig)
+                return  # cached values, until the IOC's arrive
+            md = {k: kwargs[k] for k in CACHED_KEYS if k in kwargs}
+            if "enum_strs" in md and md["enum_strs"] is not None:
+                md["enum_strs"] = list(md["enum_strs"])
+            if len(md) == 0:
+                return
+            with self._lock:
+                self._fresh.add(pvname)
+                cached = entries.get(pvname)
+                if cached != md:
+                    if cached is not None:
+                        logger.info("%s: PV metadata changed", pvname)
+                    entries[pvname] = md
+                    self._dirty = True
+
+        return update
+
+
+pv_metadata_cache = PVMetadataCache()
+atexit.register(pv_metadata_cache.save)
@@ -13,4 +13,9 @@ setup (
     name='instrument',
     version='0.0.1',
     packages=['instrument',],
+    install_requires=[
+        # instrument.callbacks.spec_writer subclasses SpecWriterCallback
+        # (uses its scan data), apstools.filewriters is gone in 1.6
+        'apstools >=1.5.3, <1.6',
+        ],
     )  